@@ -0,0 +1,186 @@
+"""
+Benchmarks of the client against the local mock OD API.
+
+Measures throughput, p50/p99 latency and peak memory of `frequency`,
+`frequencies`, paginated `ngrams` and `pmi` in the synchronous mode and in
+the concurrent modes (threads and `AsyncClient`). Results can be saved as
+JSON and compared with a baseline to catch regressions.
+
+Usage: python -m benchmarks.benchmark --words 200 --latency 0.01 --json results.json
+       python -m benchmarks.benchmark --baseline results.json --tolerance 0.2
+
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.mock_server import MockServer
+from odapi_client import AsyncClient, Client
+
+Result = dict
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def measure(name, mode, items, run):
+    """Run `run()` returning per-operation latencies and summarise it
+
+    The timed run is followed by a second run tracing the peak memory, so the
+    overhead of tracemalloc does not distort the latencies and throughput.
+
+    """
+    start = time.perf_counter()
+    latencies = run()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Result(name=name, mode=mode, items=items, seconds=elapsed, throughput=items / elapsed,
+                  p50=percentile(latencies, 0.5), p99=percentile(latencies, 0.99), peak_memory=peak)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+async def async_timed(coroutine):
+    start = time.perf_counter()
+    await coroutine
+    return time.perf_counter() - start
+
+
+class Benchmark(object):
+    """Scenarios run against a mock server"""
+
+    def __init__(self, server, words=100, workers=8, rpm=100000):
+        self.server = server
+        self.workers = workers
+        self.rpm = rpm
+        corpus = server.corpus
+        self.words = corpus.words[:words]
+        self.phrases = self.words + [' '.join(tokens) for tokens in corpus.ngrams[2][:words]]
+        self.contains = corpus.words[:max(1, words // 20)]
+        self.pairs = list(zip(self.words, self.words[1:]))
+
+    def client(self, **kwargs):
+        return Client(app_id='bench', app_key='bench', endpoint=self.server.endpoint, rpm=self.rpm, **kwargs)
+
+    def async_client(self):
+        return AsyncClient(app_id='bench', app_key='bench', endpoint=self.server.endpoint, rpm=self.rpm,
+                           max_concurrency=self.workers)
+
+    def threaded(self, function, items):
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            return list(executor.map(lambda item: timed(function, item), items))
+
+    def run_async(self, make_coroutine, items):
+        async def main():
+            async with self.async_client() as client:
+                return await asyncio.gather(*(async_timed(make_coroutine(client, item)) for item in items))
+        return asyncio.run(main())
+
+    def frequency(self):
+        with self.client() as client:
+            yield measure('frequency', 'sync', len(self.words), lambda: [timed(client.frequency, w) for w in self.words])
+        with self.client() as client:
+            yield measure('frequency', 'threads', len(self.words), lambda: self.threaded(client.frequency, self.words))
+        yield measure('frequency', 'async', len(self.words),
+                      lambda: self.run_async(lambda client, w: client.frequency(w), self.words))
+
+    def frequencies(self):
+        with self.client() as client:
+            yield measure('frequencies', 'sync', len(self.phrases),
+                          lambda: [timed(client.frequencies, *self.phrases, workers=1)])
+        with self.client() as client:
+            yield measure('frequencies', 'threads', len(self.phrases),
+                          lambda: [timed(client.frequencies, *self.phrases, workers=self.workers)])
+        yield measure('frequencies', 'async', len(self.phrases),
+                      lambda: self.run_async(lambda client, words: client.frequencies(*words), [self.phrases]))
+
+    def ngrams(self):
+        def ngrams(client, word):
+            return client.ngrams(2, contains=word, length=-1)
+        total = sum(len(self.server.corpus.containing[2].get(w, [])) for w in self.contains)
+        with self.client() as client:
+            yield measure('ngrams', 'sync', total, lambda: [timed(ngrams, client, w) for w in self.contains])
+        with self.client() as client:
+            yield measure('ngrams', 'threads', total, lambda: self.threaded(lambda w: ngrams(client, w), self.contains))
+        yield measure('ngrams', 'async', total,
+                      lambda: self.run_async(lambda client, w: client.ngrams(2, contains=w, length=-1), self.contains))
+
+    def pmi(self):
+        with self.client() as client:
+            client.corpus_size
+            yield measure('pmi', 'sync', len(self.pairs), lambda: [timed(client.pmi, w1, w2) for w1, w2 in self.pairs])
+        with self.client() as client:
+            yield measure('pmi', 'threads', len(self.pairs), lambda: self.threaded(lambda p: client.pmi(*p), self.pairs))
+        with self.client() as client:
+            yield measure('pmi', 'pmi_many', len(self.pairs), lambda: [timed(client.pmi_many, self.pairs)])
+
+    def run(self, scenarios):
+        for scenario in scenarios:
+            yield from getattr(self, scenario)()
+
+
+def compare(results, baseline, tolerance):
+    """Return the descriptions of results with throughput lower than the baseline by more than `tolerance`"""
+    previous = {(r['name'], r['mode']): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r['name'], r['mode']))
+        if old and r['throughput'] < old['throughput'] * (1.0 - tolerance):
+            regressions.append('{name}/{mode}: {throughput:.1f} items/s'.format(**r) +
+                               ' (baseline {:.1f})'.format(old['throughput']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--words', type=int, default=100, help='number of words per scenario')
+    parser.add_argument('--corpus', type=int, default=20000, help='number of words and ngrams in the corpus')
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds added to each response')
+    parser.add_argument('--workers', type=int, default=8, help='threads or concurrent requests')
+    parser.add_argument('--rpm', type=float, default=100000, help='rate limit of the clients')
+    parser.add_argument('--scenarios', nargs='+', default=['frequency', 'frequencies', 'ngrams', 'pmi'])
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--baseline', help='compare the throughput with results saved earlier')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    args = parser.parse_args(argv)
+    results = []
+    with MockServer(words=args.corpus, ngrams=args.corpus, latency=args.latency) as server:
+        benchmark = Benchmark(server, args.words, args.workers, args.rpm)
+        print('{:<12} {:<9} {:>8} {:>12} {:>10} {:>10} {:>10}'.format(
+            'scenario', 'mode', 'items', 'items/s', 'p50 ms', 'p99 ms', 'peak KiB'))
+        for r in benchmark.run(args.scenarios):
+            results.append(r)
+            print('{name:<12} {mode:<9} {items:>8} {throughput:>12.1f} {:>10.2f} {:>10.2f} {:>10.0f}'.format(
+                r['p50'] * 1000, r['p99'] * 1000, r['peak_memory'] / 1024, **r))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('Regression:', regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
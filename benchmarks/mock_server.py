@@ -0,0 +1,232 @@
+"""
+A local stand-in for the statistics endpoints of the Oxford Dictionaries API.
+
+The server generates a synthetic corpus with Zipf-distributed frequencies and
+answers `/stats/frequency/word/en/`, `/stats/frequency/words/en/` and
+`/stats/frequency/ngrams/en/nmc/{n}/` honouring `limit` and `offset`.
+Latency and throttling (429) can be injected to exercise the client.
+
+Usage: python -m benchmarks.mock_server --port 8000 --words 100000
+
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import random
+import re
+import string
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+NGRAM_PATH = re.compile(r'^/stats/frequency/ngrams/en/nmc/([1-4])/?$')
+
+
+def synthetic_words(n, seed=0):
+    """Return `n` distinct lowercase words starting with "the" (used by the client for the corpus size)"""
+    rng = random.Random(seed)
+    words = ['the']
+    seen = set(words)
+    while len(words) < n:
+        word = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+class Corpus(object):
+    """Synthetic corpus of words and ngrams with Zipf-distributed frequencies"""
+
+    def __init__(self, words=10000, ngrams=10000, seed=0):
+        self.words = synthetic_words(words, seed)
+        self.total = sum(self.zipf(rank) for rank in range(len(self.words)))
+        self.word_ranks = {w: rank for rank, w in enumerate(self.words)}
+        rng = random.Random(seed)
+        self.ngrams = {}
+        self.ngram_ranks = {}
+        self.containing = {}
+        # frequent words take part in more ngrams
+        weights = [1.0 / (rank + 1) for rank in range(len(self.words))]
+        for n in (2, 3, 4):
+            seen = collections.OrderedDict()
+            while len(seen) < ngrams:
+                seen[tuple(rng.choices(self.words, weights, k=n))] = None
+            self.ngrams[n] = list(seen)
+            self.ngram_ranks[n] = {' '.join(tokens): rank for rank, tokens in enumerate(self.ngrams[n])}
+            containing = self.containing[n] = collections.defaultdict(list)
+            for rank, tokens in enumerate(self.ngrams[n]):
+                for token in set(tokens):
+                    containing[token].append(rank)
+
+    @staticmethod
+    def zipf(rank):
+        return 10 ** 7 // (rank + 1)
+
+    def word_result(self, word):
+        rank = self.word_ranks.get(word)
+        frequency = 0 if rank is None else self.zipf(rank)
+        return {
+            'lemma': word, 'trueCase': word, 'wordform': word, 'lexicalCategory': 'noun',
+            'frequency': frequency, 'normalizedFrequency': frequency * 10 ** 6 / self.total,
+        }
+
+    def ngram_result(self, n, rank):
+        return {'tokens': list(self.ngrams[n][rank]), 'frequency': self.zipf(rank) // (10 ** (n - 1))}
+
+
+class _Server(ThreadingHTTPServer):
+    # the default backlog of 5 drops the connections of concurrent benchmarks
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class MockServer(object):
+    """Threaded HTTP server imitating the OD API on localhost
+
+    `latency` seconds are added to every response, `error_rate` is the
+    probability of answering 429 and `rps` caps the requests per second
+    (excess requests get 429 with a `Retry-After` header).
+
+    """
+
+    def __init__(self, port=0, words=10000, ngrams=10000, latency=0.0, error_rate=0.0, rps=None, seed=0):
+        self.corpus = Corpus(words, ngrams, seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rps = rps
+        self.requests = collections.Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = (0, 0)
+        self.httpd = _Server(('127.0.0.1', port), self._handler())
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def throttled(self):
+        """Return True when the current request should be answered with 429"""
+        with self._lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return True
+            if self.rps:
+                second = int(time.time())
+                start, count = self._window if self._window[0] == second else (second, 0)
+                self._window = (start, count + 1)
+                return count >= self.rps
+        return False
+
+    def respond(self, path, query):
+        """Return the status and the body answering `path` with `query`"""
+        corpus = self.corpus
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', ['100'])[0])
+        if path.rstrip('/') == '/stats/frequency/word/en':
+            word = (query.get('trueCase') or query.get('wordform') or query.get('lemma') or [''])[0]
+            if not word:
+                return 400, {'error': 'Missing filter'}
+            return 200, {'metadata': {'provider': 'mock'}, 'result': corpus.word_result(word)}
+        if path.rstrip('/') == '/stats/frequency/words/en':
+            words = query.get('trueCases') or query.get('trueCase') or query.get('lemma') or query.get('wordform')
+            if words is None:
+                ranks = range(len(corpus.words))
+                words = (corpus.words[rank] for rank in ranks)
+                total = len(ranks)
+            else:
+                words = [w for w in words if w in corpus.word_ranks]
+                total = len(words)
+            page = [corpus.word_result(w) for w in itertools.islice(words, offset, offset + limit)]
+            return 200, self.page(page, total, offset, limit)
+        match = NGRAM_PATH.match(path)
+        if match:
+            n = int(match.group(1))
+            if n == 1:
+                return 400, {'error': 'Use /words/ for unigrams'}
+            if 'tokens' in query:
+                ranks = [corpus.ngram_ranks[n][t] for t in query['tokens'] if t in corpus.ngram_ranks[n]]
+            elif 'contains' in query:
+                ranks = corpus.containing[n].get(query['contains'][0], [])
+            else:
+                return 400, {'error': 'Provide tokens or contains'}
+            page = [corpus.ngram_result(n, rank) for rank in ranks[offset:offset + limit]]
+            return 200, self.page(page, len(ranks), offset, limit)
+        return 404, {'error': 'Unknown path {}'.format(path)}
+
+    @staticmethod
+    def page(results, total, offset, limit):
+        return {'metadata': {'total': total, 'options': {'limit': limit, 'offset': offset}}, 'results': results}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # send the headers and the body in one segment
+            disable_nagle_algorithm = True
+            wbufsize = 64 * 1024
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = re.sub(r'^/api/v1', '', url.path)
+                with server._lock:
+                    server.requests[path] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if not (self.headers.get('app_id') and self.headers.get('app_key')):
+                    status, body, headers = 403, {'error': 'Authentication failed'}, {}
+                elif server.throttled():
+                    status, body, headers = 429, {'error': 'Too many requests'}, {'Retry-After': '1'}
+                else:
+                    status, body = server.respond(path, parse_qs(url.query))
+                    headers = {}
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--words', type=int, default=10000)
+    parser.add_argument('--ngrams', type=int, default=10000, help='ngrams of each size')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of a 429 response')
+    parser.add_argument('--rps', type=int, default=None, help='requests per second before answering 429')
+    args = parser.parse_args()
+    mock = MockServer(args.port, args.words, args.ngrams, args.latency, args.error_rate, args.rps)
+    print('Serving a mock OD API at {}'.format(mock.endpoint))
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        mock.httpd.server_close()
@@ -0,0 +1,91 @@
+"""
+Cold start benchmark of the client.
+
+Measures in fresh interpreters the time to import `odapi_client`, to create
+the shared default client and to complete the first request against the
+local mock OD API. Results can be saved as JSON and compared with a baseline.
+
+Usage: python -m benchmarks.startup --runs 20 --json startup.json
+       python -m benchmarks.startup --baseline startup.json --tolerance 0.2
+
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.benchmark import percentile
+from benchmarks.mock_server import MockServer
+
+# run in a new interpreter, prints the duration of each stage in seconds
+CHILD = """
+import json, time
+start = time.perf_counter()
+import odapi_client
+imported = time.perf_counter()
+client = odapi_client.default_client()
+created = time.perf_counter()
+client.frequency('the')
+done = time.perf_counter()
+print(json.dumps({'import': imported - start, 'client': created - imported, 'first_request': done - created}))
+"""
+
+STAGES = ('import', 'client', 'first_request', 'process')
+
+
+def run_child(endpoint):
+    """Start an interpreter making one request and return the durations of its stages"""
+    env = dict(os.environ, ODAPI_APP_ID='bench', ODAPI_APP_KEY='bench', ODAPI_ENDPOINT=endpoint, ODAPI_RPM='100000',
+               PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env.pop('ODAPI_METADATA', None)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD], env=env, check=True, capture_output=True, text=True).stdout
+    rv = json.loads(output)
+    rv['process'] = time.perf_counter() - start
+    return rv
+
+
+def compare(results, baseline, tolerance):
+    """Return the descriptions of stages slower than the baseline by more than `tolerance`"""
+    previous = {r['stage']: r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get(r['stage'])
+        if old and r['p50'] > old['p50'] * (1.0 + tolerance):
+            regressions.append('{stage}: {:.1f} ms (baseline {:.1f} ms)'.format(r['p50'] * 1000, old['p50'] * 1000, **r))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10, help='number of interpreters started')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--baseline', help='compare the durations with results saved earlier')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    args = parser.parse_args(argv)
+    with MockServer(words=100, ngrams=100) as server:
+        runs = [run_child(server.endpoint) for _ in range(args.runs)]
+    results = []
+    print('{:<14} {:>10} {:>10}'.format('stage', 'p50 ms', 'p90 ms'))
+    for stage in STAGES:
+        durations = [r[stage] for r in runs]
+        r = dict(stage=stage, runs=len(durations), p50=percentile(durations, 0.5), p90=percentile(durations, 0.9))
+        results.append(r)
+        print('{:<14} {:>10.2f} {:>10.2f}'.format(stage, r['p50'] * 1000, r['p90'] * 1000))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('Regression:', regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,7 +10,7 @@ from odapi_client import *
 
 if __name__ == '__main__':
     # TODO: replace with your own credentials credentials
-    client = Client(app_id=os.environ['app_id'], app_key=os.environ['app_key'])
+    client = Client(app_id=os.environ['ODAPI_APP_ID'], app_key=os.environ['ODAPI_APP_KEY'])
     words = ['test', 'unit test', 'smoke test']
     for word in words:
         res = client.frequency('test')
@@ -9,7 +9,7 @@ import requests
 from pprint import pprint
 
 # TODO: replace with your own credentials
-app_id, app_key = os.environ['app_id'], os.environ['app_key']
+app_id, app_key = os.environ['ODAPI_APP_ID'], os.environ['ODAPI_APP_KEY']
 url = 'https://od-api.oxforddictionaries.com/api/v1/stats/frequency/word/en/'
 
 if __name__ == '__main__':
@@ -4,11 +4,11 @@ from pprint import pprint
 from odapi_client import *
 
 # TODO: replace with your own credentials
-app_id, app_key = os.environ['app_id'], os.environ['app_key']
+app_id, app_key = os.environ['ODAPI_APP_ID'], os.environ['ODAPI_APP_KEY']
 url = 'https://od-api.oxforddictionaries.com/api/v1/stats/frequency/ngrams/en/nmc/2/'
 
 if __name__ == '__main__':
-    client = Client(app_id=os.environ['app_id'], app_key=os.environ['app_key'])
+    client = Client(app_id=os.environ['ODAPI_APP_ID'], app_key=os.environ['ODAPI_APP_KEY'])
     ngrams = client.ngrams(n=2, contains='testing', length=10)
     pprint(ngrams)
     pprint(('length:', len(ngrams)))
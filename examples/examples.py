@@ -8,18 +8,18 @@ Author: Oxford University Press
 
 import datetime
 import logging
-import os
 from pprint import pprint
 from odapi_client import *
 
 
 class Examples:
 
-    client = Client(app_id=os.environ['app_id'], app_key=os.environ['app_key'])
-
     def __init__(self, app_id=None, app_key=None, headers=None):
         if app_id and app_key:
             self.client = Client(app_id=app_id, app_key=app_key, headers=headers)
+        else:
+            # credentials from the environment variables ODAPI_APP_ID and ODAPI_APP_KEY
+            self.client = default_client()
 
     def simple(self):
         print('net:', self.client.frequency('net'))
@@ -79,6 +79,15 @@ class Examples:
         final_score = basic_score * multiplier
         return final_score, multiplier, normalized_freq, frequency
 
+    def wordform_scores(self, lemma='test'):
+        """Print scores of the wordforms of a lemma computed over columns (see `word_score`)"""
+        frame = self.client.word_stats_list(lemma=lemma, as_frame=True)
+        # multipliers indexed by the frequency band
+        multipliers = [0, 0, 2.0, 1.75, 1.5, 1.25, 1.0, 0.75, 0.5]
+        scores = [len(w) * multipliers[band] for w, band in zip(frame.words, frame.bands())]
+        for w, score in zip(frame.words, scores):
+            print(w, score)
+
     def more_frequent(self, word1='doctors and nurses', word2='nurses and doctors'):
         f1, f2 = self.client.frequencies(word1, word2).values()
         if f1 < f2:
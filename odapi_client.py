@@ -7,18 +7,89 @@ the rate at which queries are made and allows
 queries with multiple words in one call.
 
 """
+import array
 import collections
+import concurrent.futures
+import contextlib
+import copy
+import functools
+import gzip
+import json
 import logging
-import requests
+import mmap
+import operator
+import os
+import random
+import re
+import sqlite3
+import struct
+import sys
+import threading
 import time
 
 from math import log2
 
-__all__ = ['Client', 'OupClientError', 'ConfigError', 'RequestError', 'ArgumentError']
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # fall back to the standard decoder
+    _json_loads = json.loads
+
+__all__ = ['Client', 'AsyncClient', 'OupClientError', 'ConfigError', 'RequestError', 'ArgumentError',
+           'QuotaExceededError', 'Cache', 'MemoryCache', 'SqliteCache', 'RateLimiter', 'AdaptiveRateLimiter',
+           'FileRateLimiter', 'Snapshot', 'SnapshotClient', 'build_snapshot', 'write_snapshot', 'Collocations', 'Metrics',
+           'BatchResult', 'record_type', 'FrequencyFrame',
+           'CorpusMetadata', 'default_metadata', 'CrawlJob', 'run_crawl_jobs', 'NgramLattice',
+           'default_client', 'PriorityScheduler',
+           'Credential', 'CredentialPool', 'RecordingSession', 'ReplaySession',
+           'RecordedResponse', 'read_traffic', 'replay_traffic']
 
 log = logging.getLogger('odapi_client')
 
 
+def __getattr__(name):
+    # the HTTP stack is imported on first use to keep importing the module fast
+    if name == 'requests':
+        return _requests()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def _requests():
+    global requests
+    try:
+        return requests
+    except NameError:
+        import requests as module
+        requests = module
+        return requests
+
+# throttled or temporarily unavailable responses are retried by the session adapter
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+WORD_PATH = '/stats/frequency/word/en/'
+WORDS_PATH = '/stats/frequency/words/en/'
+NGRAMS_PATH = '/stats/frequency/ngrams/en/nmc/{}/'
+
+# the maximum number of words or ngrams the API accepts in one query
+BATCH_SIZE = 10
+
+# the longest ngrams the API provides frequencies of
+MAX_NGRAM = 4
+
+# cache path of the frequencies of single words and phrases
+PHRASE_PATH = '/phrase/frequency/'
+
+# magic, number of entries, size of the keys in bytes, corpus size
+SNAPSHOT_HEADER = struct.Struct('<8sQQd')
+SNAPSHOT_MAGIC = b'ODSNAP1\0'
+
+Collocations = collections.namedtuple('Collocations', 'pmi npmi log_likelihood')
+
+# methods that can be used in `Client.run_batch`
+BATCH_METHODS = ('frequency', 'word_frequency', 'word_stats', 'word_stats_list', 'ngrams', 'ngram_frequency',
+                 'frequencies', 'pmi')
+BatchResult = collections.namedtuple('BatchResult', 'index query result error')
+
+
 class OupClientError(Exception):
     """General Client Error"""
 
@@ -38,17 +109,1090 @@ class ConfigError(OupClientError):
     """Error representing incorrect configuration of a client"""
 
 
-class Client(object):
-    """The client wraps requests calls and provides sensible defaults to simplify querying the OD API"""
+class QuotaExceededError(OupClientError):
+    """Error raised when a request would exceed the quota of the API plan"""
+
+
+class Cache(object):
+    """Base class of the response caches used by `Client.request`
+
+    Subclasses implement `_get` and `_set`; entries older than `ttl` seconds
+    are treated as missing. The `stats` counter tracks hits, misses and evictions.
+
+    """
+
+    def __init__(self, ttl=None):
+        if ttl is not None and ttl <= 0:
+            raise ConfigError('The cache time-to-live (`ttl`) has to be more than 0')
+        self.ttl = ttl
+        self.stats = collections.Counter()
+
+    def _expires(self):
+        return time.time() + self.ttl if self.ttl else None
+
+    def get(self, key):
+        """Return the cached value of `key` or None."""
+        value = self._get(key)
+        self.stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def set(self, key, value):
+        """Store `value` under `key`."""
+        self._set(key, value)
+
+    def clear(self):
+        """Remove all entries."""
+        raise NotImplementedError
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+
+class MemoryCache(Cache):
+    """In-memory LRU cache holding at most `max_entries` responses"""
+
+    def __init__(self, max_entries=10000, ttl=None):
+        super().__init__(ttl)
+        if max_entries <= 0:
+            raise ConfigError('The cache size (`max_entries`) has to be more than 0')
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                self.stats['evictions'] += 1
+                return None
+            self._entries.move_to_end(key)
+        # callers are free to modify what they get back
+        return copy.deepcopy(value)
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._expires(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+
+class SqliteCache(Cache):
+    """Persistent cache stored in an SQLite database that can be shared by several processes
+
+    When `max_entries` is set the least recently used entries are removed
+    once the cache grows past it.
+
+    """
+
+    def __init__(self, path, ttl=None, max_entries=None, timeout=30.0):
+        super().__init__(ttl)
+        if max_entries is not None and max_entries <= 0:
+            raise ConfigError('The cache size (`max_entries`) has to be more than 0')
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS cache '
+                       '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=self.timeout)
+            db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def clear(self):
+        with self._connection() as db:
+            db.execute('DELETE FROM cache')
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def _get(self, key):
+        db = self._connection()
+        row = db.execute('SELECT value, expires FROM cache WHERE key = ?', (key, )).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        now = time.time()
+        if expires is not None and expires < now:
+            with db:
+                db.execute('DELETE FROM cache WHERE key = ?', (key, ))
+            self.stats['evictions'] += 1
+            return None
+        if self.max_entries:
+            with db:
+                db.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(value)
+
+    def _set(self, key, value):
+        with self._connection() as db:
+            db.execute('INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                       (key, json.dumps(value), self._expires(), time.time()))
+            if self.max_entries:
+                cursor = db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                                    'ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.max_entries, ))
+                self.stats['evictions'] += max(cursor.rowcount, 0)
+
+
+class CorpusMetadata(object):
+    """Thread-safe store of corpus-level constants such as the corpus size
+
+    Values are kept per key (see `Client.metadata_key`) together with the time
+    they were computed. With `path` the store is loaded from and saved to a JSON
+    file, so new processes start without extra API calls. Processes sharing the
+    file merge their values into it (locked through `path` + '.lock'). Values older than
+    `max_age` seconds are recomputed on access and, with `refresh_interval`,
+    a background thread recomputes all values used so far on that schedule.
+    A value is computed by one caller at a time without blocking the lookups
+    of other keys; `aget` is the version for asynchronous clients.
+
+    """
+
+    def __init__(self, path=None, max_age=None, refresh_interval=None):
+        self.path = path
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self._values = {}
+        self._computations = {}
+        # futures of the values being computed by key
+        self._in_flight = {}
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._thread = None
+        if path:
+            self._values = self._load()
+
+    def get(self, key, compute=None):
+        """Return the value of `key` computing and storing it with `compute()` when missing or stale."""
+        entry, call, leader = self._lookup(key, compute, compute)
+        if call is None:
+            return entry['value'] if entry else None
+        if not leader:
+            return call.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            self._finish(key, call, exception=e)
+            raise
+        return self._finish(key, call, value)
+
+    async def aget(self, key, compute=None):
+        """Return the value of `key` computing it with the coroutine function `compute` when missing or stale."""
+        import asyncio
+        refresh = functools.partial(_run_in_loop, asyncio.get_running_loop(), compute) if compute else None
+        entry, call, leader = self._lookup(key, compute, refresh)
+        if call is None:
+            return entry['value'] if entry else None
+        if not leader:
+            return await asyncio.wrap_future(call)
+        try:
+            value = await compute()
+        except BaseException as e:
+            self._finish(key, call, exception=e)
+            raise
+        return self._finish(key, call, value)
+
+    def _lookup(self, key, compute, refresh):
+        """Return the entry of `key` and, when it has to be computed, its future and whether the caller computes it"""
+        with self._lock:
+            entry = self._values.get(key)
+            fresh = entry is not None and not (self.max_age and time.time() - entry['updated'] > self.max_age)
+            if refresh is not None:
+                self._computations[key] = refresh
+                self._start_refresh()
+            if fresh or compute is None:
+                return entry, None, False
+            call = self._in_flight.get(key)
+            if call is not None:
+                return entry, call, False
+            call = self._in_flight[key] = concurrent.futures.Future()
+            return entry, call, True
+
+    def _finish(self, key, call, value=None, exception=None):
+        if exception is None:
+            self.set(key, value)
+        with self._lock:
+            del self._in_flight[key]
+        if exception is None:
+            call.set_result(value)
+        else:
+            call.set_exception(exception)
+        return value
+
+    def set(self, key, value):
+        """Store `value` under `key`."""
+        with self._lock:
+            self._values[key] = {'value': value, 'updated': time.time()}
+            self._save()
+        return value
+
+    def refresh(self):
+        """Recompute all values that have been computed so far."""
+        with self._lock:
+            computations = list(self._computations.items())
+        for key, compute in computations:
+            try:
+                self.set(key, compute())
+            except _LoopNotRunning as e:
+                log.debug('Skipping the refresh of corpus metadata "{}" outside its event loop'.format(key))
+                if e.args[0]:
+                    with self._lock:
+                        if self._computations.get(key) is compute:
+                            del self._computations[key]
+            except Exception:
+                log.exception('Failed to refresh corpus metadata "{}"'.format(key))
+
+    def close(self):
+        """Stop the background refresh."""
+        self._stopped.set()
+
+    def _start_refresh(self):
+        if self.refresh_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name='odapi-metadata', daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            log.warning('Ignoring unreadable corpus metadata "{}"'.format(self.path))
+            return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            import fcntl
+        except ImportError:  # without fcntl concurrent writers may lose each other's keys
+            fcntl = None
+        # the file is replaced on every save, so the lock is held on a separate file
+        with open(self.path + '.lock', 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # merge the values saved by other processes keeping the newer one of every key
+                for key, entry in self._load().items():
+                    if key not in self._values or entry['updated'] > self._values[key]['updated']:
+                        self._values[key] = entry
+                tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+                with open(tmp, 'w') as f:
+                    json.dump(self._values, f)
+                os.replace(tmp, self.path)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class _LoopNotRunning(Exception):
+    """The event loop of an asynchronously computed value is not running (args: whether it is closed)"""
+
+
+def _run_in_loop(loop, compute):
+    """Run the coroutine function `compute` in the event loop `loop` from another thread"""
+    import asyncio
+    if not loop.is_running():
+        raise _LoopNotRunning(loop.is_closed())
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    if current is loop:
+        raise RuntimeError('The value cannot be recomputed from inside its own event loop')
+    return asyncio.run_coroutine_threadsafe(compute(), loop).result()
+
+
+_default_metadata = None
+_default_metadata_lock = threading.Lock()
+
+
+def default_metadata():
+    """Return the corpus metadata shared by clients of this process
+
+    It is saved to the file named by the environment variable `ODAPI_METADATA`
+    when that is set and kept in memory otherwise.
+
+    """
+    global _default_metadata
+    with _default_metadata_lock:
+        if _default_metadata is None:
+            _default_metadata = CorpusMetadata(os.environ.get('ODAPI_METADATA'))
+        return _default_metadata
+
+
+class RateLimiter(object):
+    """Token bucket allowing one request per `interval` seconds and bursts of up to `burst` requests
+
+    The bucket is implemented as a generic cell rate algorithm: every call to
+    `reserve` books the next free slot, so concurrent callers queue up fairly.
+    Optionally, the plan quotas `per_minute` and `per_month` (calendar month in UTC)
+    are enforced as well; requests over the monthly quota raise `QuotaExceededError`.
+    The limiter is thread-safe; use `FileRateLimiter` to share it between processes.
+
+    """
+
+    # adaptive limiters handle throttled (429) responses instead of the session
+    adaptive = False
+
+    def __init__(self, interval=1.0, burst=1, per_minute=None, per_month=None):
+        if interval < 0:
+            raise ConfigError('The interval between requests has to be at least 0')
+        if burst < 1:
+            raise ConfigError('The burst capacity (`burst`) has to be at least 1')
+        if per_minute is not None and per_minute <= 0:
+            raise ConfigError('The quota per minute (`per_minute`) has to be more than 0')
+        if per_month is not None and per_month <= 0:
+            raise ConfigError('The quota per month (`per_month`) has to be more than 0')
+        self.interval = interval
+        self.burst = burst
+        self.per_minute = per_minute
+        self.per_month = per_month
+        # (interval, burst) of every bucket a request has to fit in
+        self.buckets = [(interval, burst)]
+        if per_minute:
+            self.buckets.append((60.0 / per_minute, per_minute))
+        self._lock = threading.Lock()
+        self._shared = self._initial_state()
+
+    def _initial_state(self):
+        # `tat` holds the theoretical arrival time of the next request for each bucket
+        return {'tat': [0.0] * len(self.buckets), 'month': '', 'month_count': 0, 'waited': 0.0, 'requests': 0}
+
+    @contextlib.contextmanager
+    def _state(self):
+        """Provide exclusive access to the state of the limiter"""
+        with self._lock:
+            yield self._shared
+
+    def reserve(self):
+        """Book a slot for a request and return the number of seconds to wait before sending it."""
+        with self._state() as state:
+            now = time.time()
+            month = time.strftime('%Y-%m', time.gmtime(now))
+            if state['month'] != month:
+                state['month'], state['month_count'] = month, 0
+            if self.per_month and state['month_count'] >= self.per_month:
+                raise QuotaExceededError('The monthly quota of {} requests has been used up'.format(self.per_month))
+            tats = self._tats(state)
+            start = self._start(tats, now)
+            state['tat'] = [max(tat, start) + interval for (interval, _), tat in zip(self.buckets, tats)]
+            state['month_count'] += 1
+            state['requests'] += 1
+            state['waited'] += start - now
+            return start - now
+
+    def delay(self):
+        """Return the number of seconds a request would wait now without booking a slot."""
+        with self._state() as state:
+            now = time.time()
+            return self._start(self._tats(state), now) - now
+
+    def _tats(self, state):
+        return (state['tat'] + [0.0] * len(self.buckets))[:len(self.buckets)]
+
+    def _start(self, tats, now):
+        """Return the earliest time a request fits in all buckets"""
+        start = now
+        for (interval, burst), tat in zip(self.buckets, tats):
+            start = max(start, max(tat, now) - (burst - 1) * interval)
+        return start
+
+    def acquire(self):
+        """Wait until a request can be sent."""
+        wait_time = self.reserve()
+        if wait_time > 0.0:
+            log.debug('Waiting due to rate limit ({})'.format(wait_time))
+            time.sleep(wait_time)
+        return wait_time
+
+    def usage(self):
+        """Return the number of requests, the time callers waited and the requests left this month."""
+        with self._state() as state:
+            month = time.strftime('%Y-%m', time.gmtime())
+            month_count = state['month_count'] if state['month'] == month else 0
+            return {
+                'requests': state['requests'],
+                'waited': state['waited'],
+                'month': month,
+                'month_requests': month_count,
+                'month_remaining': self.per_month - month_count if self.per_month else None,
+            }
+
+    @property
+    def waited(self):
+        """Total number of seconds callers waited for the limiter"""
+        return self.usage()['waited']
+
+    def __getstate__(self):
+        # limiters are sent to worker processes without their locks
+        state = self.__dict__.copy()
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def throttled(self, retry_after=None, reserved=None):
+        """Called when the server throttled a request reserved at the time `reserved`; adaptive limiters slow down."""
+
+    def succeeded(self, reserved=None):
+        """Called after a successful request reserved at the time `reserved`; adaptive limiters speed up."""
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """Rate limiter that learns the highest rate the server accepts
+
+    When the server throttles a request (429) the interval between requests is
+    multiplied by `backoff` (up to `max_interval`) and all callers pause for the
+    `Retry-After` time or the new interval plus random jitter. The limiter backs
+    off once per throttling episode: responses to requests reserved before the
+    last back-off are ignored. After every `recovery_after` successful requests
+    reserved after the pause the interval shrinks by `recovery` (down to
+    `min_interval`), so a long job settles close to the highest safe rate.
+
+    """
+
+    adaptive = True
+
+    def __init__(self, interval=1.0, burst=1, per_minute=None, per_month=None,
+                 min_interval=0.0, max_interval=60.0, backoff=2.0, recovery=0.9, recovery_after=10, jitter=0.1):
+        super().__init__(interval, burst, per_minute, per_month)
+        if not 0 <= min_interval <= max_interval:
+            raise ConfigError('The interval bounds have to satisfy 0 <= min_interval <= max_interval')
+        if backoff <= 1.0 or not 0.0 < recovery < 1.0:
+            raise ConfigError('The `backoff` has to be more than 1 and `recovery` between 0 and 1')
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.recovery = recovery
+        self.recovery_after = recovery_after
+        self.jitter = jitter
+        self.throttles = 0
+        self._healthy = 0
+        # time of the last back-off and the end of the pause that followed it
+        self._backed_off = 0.0
+        self._resume = 0.0
+
+    def _set_interval(self, interval):
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        self.buckets[0] = (self.interval, self.burst)
+
+    def throttled(self, retry_after=None, reserved=None):
+        """Slow down after a throttled request reserved at the time `reserved` and return how long the callers pause."""
+        with self._state() as state:
+            now = time.time()
+            self.throttles += 1
+            if reserved is not None and reserved < self._backed_off:
+                # a request of the episode the limiter has already backed off for
+                return max(self._resume - now, 0.0)
+            self._healthy = 0
+            self._backed_off = now
+            self._set_interval(max(self.interval, 1e-3) * self.backoff)
+            pause = retry_after if retry_after is not None else self.interval
+            pause += random.uniform(0.0, self.jitter * pause)
+            self._resume = max(self._resume, now + pause)
+            # a full burst is spent so that no request starts before the pause is over
+            state['tat'] = [max(tat, self._resume + (burst - 1) * interval)
+                            for (interval, burst), tat in zip(self.buckets, self._tats(state))]
+        log.debug('Throttled by the server, pausing for {:.2f}s with interval {:.3f}s'.format(pause, self.interval))
+        return self._resume - now
+
+    def succeeded(self, reserved=None):
+        with self._lock:
+            if time.time() < self._resume or (reserved is not None and reserved < self._backed_off):
+                # the rate before the last back-off says nothing about the current one
+                return
+            self._healthy += 1
+            if self._healthy >= self.recovery_after:
+                self._healthy = 0
+                self._set_interval(self.interval * self.recovery)
+
+    @property
+    def rpm(self):
+        """The learned rate as the `rpm` argument of the clients (one request per 1/rpm seconds)"""
+        return 1.0 / self.interval if self.interval else float('inf')
+
+    @property
+    def requests_per_minute(self):
+        """The learned number of requests per minute"""
+        return 60.0 / self.interval if self.interval else float('inf')
+
+
+class FileRateLimiter(RateLimiter):
+    """Rate limiter keeping its state in a file so that several processes can share it
+
+    The file is locked while the state is updated, so all workers using the same
+    `path` (and the same API key) are throttled together. Requires `fcntl` (POSIX).
+
+    """
+
+    def __init__(self, path, interval=1.0, burst=1, per_minute=None, per_month=None):
+        super().__init__(interval, burst, per_minute, per_month)
+        try:
+            import fcntl
+        except ImportError:
+            raise ConfigError('FileRateLimiter requires a platform with fcntl')
+        self._fcntl = fcntl
+        self.path = path
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('_fcntl', None)
+        return state
+
+    def __setstate__(self, state):
+        import fcntl
+        super().__setstate__(state)
+        self._fcntl = fcntl
+
+    @contextlib.contextmanager
+    def _state(self):
+        with self._lock, open(self.path, 'a+') as f:
+            self._fcntl.flock(f, self._fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                data = f.read()
+                state = dict(self._initial_state(), **json.loads(data)) if data else self._initial_state()
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                self._fcntl.flock(f, self._fcntl.LOCK_UN)
+
+
+class PriorityScheduler(object):
+    """Share a rate limiter between priority classes by weighted fair queuing
+
+    Requests wait in a queue per class and are let through to `limiter` one at
+    a time. While a class has requests waiting it gets at least its share of
+    `shares` (e.g. ``{'interactive': 3, 'batch': 1}``) of the rate; the share a
+    class does not use goes to the others. A few interactive requests are thus
+    sent ahead of the pages queued by a large batch job. Requests without a
+    class belong to `default` (the last class by default).
+
+    """
+
+    def __init__(self, limiter=None, shares=None, default=None):
+        shares = shares or {'interactive': 3, 'batch': 1}
+        if any(share <= 0 for share in shares.values()):
+            raise ConfigError('The shares of the priority classes have to be more than 0')
+        self.limiter = limiter or RateLimiter()
+        self.shares = dict(shares)
+        self.default = default or list(self.shares)[-1]
+        if self.default not in self.shares:
+            raise ConfigError('The default priority class {!r} has no share'.format(self.default))
+        self._condition = threading.Condition()
+        self._queues = {name: collections.deque() for name in self.shares}
+        # virtual finish time of the last request of each class and of the last request let through
+        self._finish = dict.fromkeys(self.shares, 0.0)
+        self._virtual_time = 0.0
+        self._sequence = 0
+        self._busy = False
+        self._stats = {name: {'requests': 0, 'waited': 0.0, 'max_wait': 0.0} for name in self.shares}
+
+    def acquire(self, priority=None):
+        """Wait until a request of the class `priority` can be sent and return the number of seconds waited."""
+        priority = priority or self.default
+        if priority not in self.shares:
+            raise ArgumentError('Unknown priority class {!r}'.format(priority))
+        start = time.perf_counter()
+        with self._condition:
+            self._finish[priority] = max(self._virtual_time, self._finish[priority]) + 1.0 / self.shares[priority]
+            self._sequence += 1
+            ticket = (self._finish[priority], self._sequence)
+            self._queues[priority].append(ticket)
+            while self._busy or min(q[0] for q in self._queues.values() if q) != ticket:
+                self._condition.wait()
+            self._queues[priority].popleft()
+            self._virtual_time = ticket[0]
+            self._busy = True
+        try:
+            self.limiter.acquire()
+        finally:
+            waited = time.perf_counter() - start
+            with self._condition:
+                self._busy = False
+                stats = self._stats[priority]
+                stats['requests'] += 1
+                stats['waited'] += waited
+                stats['max_wait'] = max(stats['max_wait'], waited)
+                self._condition.notify_all()
+        return waited
+
+    def stats(self):
+        """Return the queue depth, the number of requests and the seconds waited of every class."""
+        with self._condition:
+            return {name: dict(stats, queued=len(self._queues[name])) for name, stats in self._stats.items()}
+
+
+class Credential(object):
+    """An app_id/app_key pair of a `CredentialPool` with its own rate limiter"""
+
+    def __init__(self, app_id, app_key, limiter):
+        self.app_id = app_id
+        self.app_key = app_key
+        self.limiter = limiter
+        self.cooldown_until = 0.0
+        self.statuses = collections.Counter()
+        self.cooldowns = 0
+
+    def __repr__(self):
+        return 'Credential({!r})'.format(self.app_id)
+
+
+class CredentialPool(object):
+    """Spread requests over several API keys, each with its own rate limit and quotas
+
+    `credentials` is a list of (app_id, app_key) pairs, optionally followed by
+    a rate limiter for the key; other keys get a limiter spacing requests 1/rpm
+    seconds apart (as `rpm` of the clients) with the given `burst` and quotas. Every request takes the key that
+    can send it soonest, preferring the key with the most requests left this
+    month. A key is not used for `cooldown` seconds (or the time in the
+    Retry-After header) after a 401, 403 or 429 response.
+
+    """
+
+    # responses after which a key is rested
+    cooldown_statuses = (401, 403, 429)
+
+    def __init__(self, credentials, rpm=1, burst=1, per_minute=None, per_month=None, cooldown=60.0):
+        if not credentials:
+            raise ConfigError('The pool needs at least one pair of credentials')
+        if rpm <= 0:
+            raise ConfigError('The number of requests per minute (`rpm`) has to be more than 0')
+        self.cooldown = cooldown
+        self.credentials = []
+        for app_id, app_key, *limiter in credentials:
+            if not (app_id and app_key):
+                raise ConfigError('Every pair of credentials needs an app_id and an app_key')
+            limiter = limiter[0] if limiter else RateLimiter(1.0 / rpm, burst, per_minute, per_month)
+            self.credentials.append(Credential(app_id, app_key, limiter))
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until one of the keys can send a request and return (credential, seconds waited)."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.time()
+                ready = [c for c in self.credentials if c.cooldown_until <= now]
+                if ready:
+                    credential = min(ready, key=self._order)
+                    wait_time = credential.limiter.reserve()
+                    break
+                wait_time = min(c.cooldown_until for c in self.credentials) - now
+            log.warning('All credentials are cooling down, waiting {:.1f}s'.format(wait_time))
+            time.sleep(wait_time)
+            waited += wait_time
+        if wait_time > 0.0:
+            log.debug('Waiting due to rate limit of {!r} ({})'.format(credential, wait_time))
+            time.sleep(wait_time)
+        return credential, waited + wait_time
+
+    @staticmethod
+    def _order(credential):
+        remaining = credential.limiter.usage()['month_remaining']
+        if remaining == 0:
+            # try exhausted keys last; their limiter raises QuotaExceededError
+            return (1, 0.0, 0)
+        return (0, credential.limiter.delay(), -(remaining if remaining is not None else float('inf')))
+
+    def release(self, credential, status, retry_after=None):
+        """Record the response status of a request sent with `credential`."""
+        with self._lock:
+            credential.statuses[status] += 1
+            if status in self.cooldown_statuses:
+                credential.cooldowns += 1
+                pause = retry_after if retry_after is not None else self.cooldown
+                credential.cooldown_until = max(credential.cooldown_until, time.time() + pause)
+                log.warning('{!r} got HTTP {}, resting it for {:.1f}s'.format(credential, status, pause))
+
+    def retry(self, status):
+        """Return whether a request answered with `status` should be sent again with another key.
+
+        Throttled requests (429) wait for a key if all are resting, rejected
+        credentials (401, 403) are retried only while another key is usable.
+
+        """
+        if status == 429:
+            return True
+        if status not in self.cooldown_statuses:
+            return False
+        with self._lock:
+            now = time.time()
+            return any(c.cooldown_until <= now for c in self.credentials)
+
+    def usage(self):
+        """Return the usage of every key (see `RateLimiter.usage`) with the response statuses by app_id."""
+        with self._lock:
+            now = time.time()
+            return {c.app_id: dict(c.limiter.usage(), statuses=dict(c.statuses), cooldowns=c.cooldowns,
+                                   cooling_down=max(c.cooldown_until - now, 0.0)) for c in self.credentials}
+
+
+class _Histogram(object):
+    """Cumulative histogram with fixed upper bounds of the buckets"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+    """Telemetry of the requests made by a client
+
+    Records per endpoint path the number of requests by HTTP status, latency
+    histograms, received bytes, pages per logical call, cache hits and errors,
+    and the time spent waiting for the rate limiter. Every recorded event is also
+    passed to the callbacks as `callback(event, fields)`; `to_prometheus` dumps
+    the metrics in the Prometheus text format.
+
+    """
+
+    latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    page_buckets = (1, 2, 5, 10, 20, 50, 100, 1000)
+
+    def __init__(self, callbacks=(), latency_buckets=None):
+        if latency_buckets:
+            self.latency_buckets = tuple(sorted(latency_buckets))
+        self.callbacks = list(callbacks)
+        self.requests = collections.Counter()
+        self.latency = {}
+        self.bytes_received = collections.Counter()
+        self.pages = {}
+        self.cache_hits = collections.Counter()
+        self.errors = collections.Counter()
+        self.rate_limit_wait = 0.0
+        self.rate_limit_waits = 0
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """Call `callback(event, fields)` for every recorded event."""
+        self.callbacks.append(callback)
+
+    def record(self, event, **fields):
+        """Record an event: request, pages, cache_hit, error or rate_limit_wait."""
+        path = fields.get('path')
+        with self._lock:
+            if event == 'request':
+                self.requests[path, fields['status']] += 1
+                self.latency.setdefault(path, _Histogram(self.latency_buckets)).observe(fields['latency'])
+                self.bytes_received[path] += fields.get('bytes', 0)
+            elif event == 'pages':
+                self.pages.setdefault(path, _Histogram(self.page_buckets)).observe(fields['pages'])
+            elif event == 'cache_hit':
+                self.cache_hits[path] += fields.get('count', 1)
+            elif event == 'error':
+                self.errors[path, fields['error']] += 1
+            elif event == 'rate_limit_wait':
+                self.rate_limit_wait += fields['seconds']
+                self.rate_limit_waits += 1
+        for callback in self.callbacks:
+            try:
+                callback(event, fields)
+            except Exception:
+                log.exception('Metrics callback failed')
+
+    def to_prometheus(self, prefix='odapi'):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, doc, samples):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, doc))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+            for suffix, labels, value in samples:
+                label_text = ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels)
+                lines.append('{}_{}{}{} {}'.format(prefix, name, suffix, '{' + label_text + '}' if labels else '',
+                                                   _format_number(value)))
+
+        def histogram_samples(histograms):
+            for path, h in sorted(histograms.items()):
+                for bound, count in zip(h.buckets, h.counts):
+                    yield '_bucket', [('path', path), ('le', bound)], count
+                yield '_bucket', [('path', path), ('le', '+Inf')], h.count
+                yield '_sum', [('path', path)], h.sum
+                yield '_count', [('path', path)], h.count
+
+        with self._lock:
+            metric('requests_total', 'counter', 'Requests sent to the API by path and HTTP status.',
+                   [('', [('path', path), ('status', status)], n)
+                    for (path, status), n in sorted(self.requests.items())])
+            metric('request_duration_seconds', 'histogram', 'Latency of the requests by path.',
+                   list(histogram_samples(self.latency)))
+            metric('response_bytes_total', 'counter', 'Bytes received by path.',
+                   [('', [('path', path)], n) for path, n in sorted(self.bytes_received.items())])
+            metric('pages_per_call', 'histogram', 'Pages fetched per logical call by path.',
+                   list(histogram_samples(self.pages)))
+            metric('cache_hits_total', 'counter', 'Pages served from the cache by path.',
+                   [('', [('path', path)], n) for path, n in sorted(self.cache_hits.items())])
+            metric('errors_total', 'counter', 'Failed requests by path and error.',
+                   [('', [('path', path), ('error', error)], n) for (path, error), n in sorted(self.errors.items())])
+            metric('rate_limit_wait_seconds_total', 'counter', 'Time spent waiting for the rate limiter.',
+                   [('', [], self.rate_limit_wait)])
+        return '\n'.join(lines) + '\n'
+
+
+class FrequencyFrame(object):
+    """Columnar table of words or ngrams with their frequencies (requires numpy)
+
+    `words` holds the true cases or the space-joined tokens, `frequency` the
+    int64 counts and `normalized_frequency` the float64 frequencies per million
+    words (NaN when the API does not provide them, e.g. for ngrams).
+
+    """
+
+    # lower bounds of the OED frequency bands 3-8 in normalized frequency
+    # http://public.oed.com/how-to-use-the-oed/key-to-frequency/
+    band_bounds = (0.01, 0.1, 1.0, 10.0, 100.0, 1000.0)
+
+    def __init__(self, words, frequency, normalized_frequency=None):
+        np = _numpy()
+        self.words = np.asarray(words, dtype=object)
+        self.frequency = np.asarray(frequency, dtype=np.int64)
+        if normalized_frequency is None:
+            normalized_frequency = np.full(len(self.words), np.nan)
+        self.normalized_frequency = np.asarray(normalized_frequency, dtype=np.float64)
+
+    @classmethod
+    def from_results(cls, pages):
+        """Build a frame from an iterable of lists of results filling the columns page by page."""
+        words = []
+        frequency = array.array('q')
+        normalized = array.array('d')
+        nan = float('nan')
+        for results in pages:
+            for r in results:
+                words.append(r['trueCase'] if 'trueCase' in r else ' '.join(r['tokens']))
+                frequency.append(r['frequency'])
+                normalized.append(r.get('normalizedFrequency', nan))
+        np = _numpy()
+        return cls(words, np.frombuffer(frequency, dtype=np.int64), np.frombuffer(normalized, dtype=np.float64))
+
+    @classmethod
+    def from_mapping(cls, frequencies):
+        """Build a frame from a mapping of words to frequencies such as the result of `frequencies`."""
+        return cls(list(frequencies), list(frequencies.values()))
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, index):
+        """Select rows by a slice, an array of positions or a boolean mask."""
+        return FrequencyFrame(self.words[index], self.frequency[index], self.normalized_frequency[index])
+
+    def __iter__(self):
+        return zip(self.words, self.frequency, self.normalized_frequency)
+
+    def bands(self):
+        """Return the OED frequency bands (1-8) of the rows based on the normalized frequency."""
+        np = _numpy()
+        nf = np.nan_to_num(self.normalized_frequency, nan=0.0)
+        return np.where(nf > 0, np.digitize(nf, self.band_bounds) + 2, 1)
+
+    def top_k(self, k):
+        """Return the `k` most frequent rows in descending order of frequency."""
+        np = _numpy()
+        k = min(k, len(self))
+        if k <= 0:
+            return self[np.zeros(0, dtype=np.int64)]
+        index = np.argpartition(-self.frequency, k - 1)[:k]
+        return self[index[np.argsort(-self.frequency[index], kind='stable')]]
+
+
+class _FrequencyBatcher(object):
+    """Collect single-word frequency lookups for `window` seconds and send them in one batch"""
+
+    def __init__(self, client, window):
+        if window <= 0:
+            raise ConfigError('The batching window (`batch_window`) has to be more than 0')
+        self.client = client
+        self.window = window
+        self._pending = collections.OrderedDict()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def frequency(self, word):
+        batch = None
+        with self._lock:
+            future = self._pending.get(word)
+            if future is None:
+                future = self._pending[word] = concurrent.futures.Future()
+            if len(self._pending) >= BATCH_SIZE:
+                batch = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._send(batch)
+        return future.result()
+
+    def _take(self):
+        batch, self._pending = self._pending, collections.OrderedDict()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def flush(self):
+        """Send the words collected so far."""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch):
+        try:
+            counts = self.client.frequencies(*batch, workers=1)
+        except BaseException as e:
+            for future in batch.values():
+                future.set_exception(e)
+        else:
+            for word, future in batch.items():
+                future.set_result(counts[word])
+
+
+class NgramLattice(object):
+    """Frequencies of all ngrams of a tokenised text up to `max_n` tokens long
+
+    The lattice is built by `sentence_ngram_frequencies` and holds every count
+    a language-model-style scorer needs, so scoring makes no requests.
+
+    """
+
+    def __init__(self, tokens, frequencies, max_n, corpus_size):
+        self.tokens = tuple(tokens)
+        self.frequencies = frequencies
+        self.max_n = max_n
+        self.corpus_size = corpus_size
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, phrase):
+        return phrase in self.frequencies
+
+    def __getitem__(self, phrase):
+        return self.frequencies[phrase]
+
+    def frequency(self, start, n=1):
+        """Return the frequency of the `n` tokens starting at the position `start`."""
+        if not 1 <= n <= self.max_n or start < 0 or start + n > len(self.tokens):
+            raise ArgumentError('No ngram of {} tokens at the position {}'.format(n, start))
+        return self.frequencies[' '.join(self.tokens[start:start + n])]
+
+    def spans(self, n):
+        """Yield (start, phrase, frequency) of the ngrams of `n` tokens in the order of the text."""
+        for start in range(len(self.tokens) - n + 1):
+            yield start, ' '.join(self.tokens[start:start + n]), self.frequency(start, n)
+
+    def probability(self, position, n=None):
+        """Return the maximum likelihood probability of the token at `position` given up to `n` - 1 previous tokens.
+
+        Returns 0 when the ngram or its history does not occur in the corpus.
+
+        """
+        n = min(n or self.max_n, position + 1)
+        count = self.frequency(position - n + 1, n)
+        history = self.frequency(position - n + 1, n - 1) if n > 1 else self.corpus_size
+        return count / history if count and history else 0.0
+
+
+class _CollocationScores(object):
+    """Vectorised collocation and phrase measures for clients providing `frequencies` and `corpus_size`"""
+
+    def sentence_ngram_frequencies(self, text, max_n=MAX_NGRAM, tokenize=None):
+        """Retrieve the frequencies of all ngrams of `text` up to `max_n` tokens as an `NgramLattice`.
+
+        The text is split into words by `tokenize` (a function returning a list
+        of tokens, by default words and apostrophes). Repeated ngrams are
+        requested once.
+
+        """
+        if not 1 <= max_n <= MAX_NGRAM:
+            raise ArgumentError('The ngram length has to be between 1 and {}'.format(MAX_NGRAM))
+        tokens = (tokenize or _tokenize)(text)
+        phrases = [' '.join(tokens[i:i + n]) for n in range(1, max_n + 1) for i in range(len(tokens) - n + 1)]
+        return NgramLattice(tokens, self.frequencies(*phrases), max_n, self.corpus_size)
+
+    def pmi_many(self, pairs):
+        """Calculate PMI, NPMI and log-likelihood of many word pairs (requires numpy).
+
+        Returns `Collocations` of arrays aligned with `pairs`; measures of pairs
+        with a zero count are 0.
+
+        """
+        pairs = list(pairs)
+        counts = self.frequencies(*_collocation_phrases(pairs))
+        c_w1_w2, c_w1, c_w2 = ([counts[w] for w in words] for words in (
+            [w1 + ' ' + w2 for w1, w2 in pairs], [w1 for w1, _ in pairs], [w2 for _, w2 in pairs]))
+        return _collocation_scores(self.corpus_size, c_w1_w2, c_w1, c_w2)
+
+    def pmi_matrix(self, left_words, right_words):
+        """Calculate collocation measures of all pairs `(left, right)` as matrices (see `pmi_many`)."""
+        left_words, right_words = list(left_words), list(right_words)
+        scores = self.pmi_many((w1, w2) for w1 in left_words for w2 in right_words)
+        shape = (len(left_words), len(right_words))
+        return Collocations(*(a.reshape(shape) for a in scores))
+
+
+class _BaseClient(object):
+    """Configuration shared by the synchronous and the asynchronous client"""
 
-    _corpus_size = None
     endpoint = 'https://od-api.oxforddictionaries.com:443/api/v1'
-    last_query = 0.0
 
-    def __init__(self, app_id=None, app_key=None, endpoint=None, headers=None, rpm=1):
+    def __init__(self, app_id=None, app_key=None, endpoint=None, headers=None, rpm=1, cache=None, metrics=None,
+                 metadata=None, credentials=None):
         if endpoint:
             self.endpoint = endpoint
         self.num_queries = 0
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
         if rpm <= 0:
             raise ConfigError('The number of requests per minute (`rpm`) has to be more than 0')
         self.rate = (1.0/float(rpm))
@@ -57,23 +1201,143 @@ class Client(object):
             self.headers.setdefault('app_id', app_id)
         if app_key:
             self.headers.setdefault('app_key', app_key)
-        if not (self.headers.get('app_id') and self.headers.get('app_key')):
+        self.credentials = credentials
+        if credentials is None and not (self.headers.get('app_id') and self.headers.get('app_key')):
             raise ConfigError('You need to provide the API credentials: app_id and app_key')
         if self.headers.setdefault('Accept', 'application/json') not in ('application/json', ):
             raise ConfigError('The client can consume only JSON')
+        self.cache = cache
+        self.metrics = metrics or Metrics()
+        self.metadata = metadata or default_metadata()
+
+    def metadata_key(self, name, corpus='nmc'):
+        """Return the key of a corpus constant in `metadata`."""
+        return json.dumps([self.endpoint, corpus, name])
+
+    def _compute_corpus_size(self, the_stats):
+        return the_stats['normalizedFrequency'] * 1000 * 1000
+
+    def cache_key(self, path, params):
+        """Return the key identifying a response in the cache."""
+        if not path.endswith('/'):
+            path += '/'
+        params = {k: list(v) if isinstance(v, (list, tuple)) else v for k, v in params.items()}
+        return json.dumps([self.endpoint + path, params], sort_keys=True)
+
+
+class Client(_CollocationScores, _BaseClient):
+    """The client wraps requests calls and provides sensible defaults to simplify querying the OD API"""
+
+    def __init__(self, app_id=None, app_key=None, endpoint=None, headers=None, rpm=1,
+                 session=None, pool_size=10, keep_alive=True, max_retries=3, backoff_factor=0.5,
+                 cache=None, burst=1, limiter=None, coalesce=True, batch_window=None, metrics=None,
+                 adaptive=False, metadata=None, scheduler=None, priority=None, credentials=None):
+        super().__init__(app_id, app_key, endpoint, headers, rpm, cache, metrics, metadata, credentials)
+        if scheduler is not None and credentials is not None:
+            raise ConfigError('A client cannot use both a scheduler and a pool of credentials')
+        self.scheduler = scheduler
+        self.priority = priority
+        if scheduler is not None:
+            if rpm != 1 or burst != 1 or adaptive or limiter not in (None, scheduler.limiter):
+                raise ConfigError('A client using a scheduler is limited by the scheduler\'s limiter, '
+                                  'set `rpm`, `burst`, `adaptive` or `limiter` on the scheduler instead')
+            limiter = scheduler.limiter
+        self.limiter = limiter or (AdaptiveRateLimiter if adaptive else RateLimiter)(self.rate, burst)
+        self.max_retries = max_retries
+        self.coalesce = coalesce
+        self._in_flight = {}
+        self._batcher = _FrequencyBatcher(self, batch_window) if batch_window else None
+        if pool_size <= 0:
+            raise ConfigError('The connection pool size (`pool_size`) has to be more than 0')
+        if not keep_alive:
+            self.headers.setdefault('Connection', 'close')
+        # throttled requests are retried by the client with another key or after slowing down
+        statuses = tuple(s for s in RETRY_STATUSES
+                         if not (s == 429 and (self.limiter.adaptive or credentials is not None)))
+        self._session = session
+        self._session_config = (pool_size, max_retries, backoff_factor, statuses)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def session(self):
+        """The session sending the requests, created on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session(*self._session_config)
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    @staticmethod
+    def _create_session(pool_size, max_retries, backoff_factor, statuses=RETRY_STATUSES):
+        """Create a session with a pooled adapter that retries throttled and failed requests."""
+        requests = _requests()
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                      status_forcelist=statuses, allowed_methods=['GET'],
+                      respect_retry_after_header=429 in statuses, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        """Close the pooled connections held by the client."""
+        if self._session is not None:
+            self._session.close()
+
+    def _update_pool_stats(self):
+        """Copy connection reuse counters from the session's connection pools into `stats`."""
+        connections = requests_sent = 0
+        for adapter in set(getattr(self._session, 'adapters', {}).values()):
+            pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+            if pools is None:
+                continue
+            for key in pools.keys():
+                pool = pools.get(key)
+                connections += getattr(pool, 'num_connections', 0)
+                requests_sent += getattr(pool, 'num_requests', 0)
+        self.stats['pool_connections'] = connections
+        self.stats['pool_requests'] = requests_sent
+        self.stats['pool_reused'] = max(requests_sent - connections, 0)
 
     @property
     def corpus_size(self):
-        if self._corpus_size is None:
-            the_stats = self.word_stats(wordform='the')
-            Client._corpus_size = the_stats['normalizedFrequency'] * 1000 * 1000
-        return self._corpus_size
+        """The size of the corpus kept in the shared `metadata`"""
+        return self.metadata.get(self.metadata_key('corpus_size'),
+                                 lambda: self._compute_corpus_size(self.word_stats(wordform='the')))
+
+    @corpus_size.setter
+    def corpus_size(self, value):
+        self.metadata.set(self.metadata_key('corpus_size'), value)
+
+    def normalized_frequencies(self, *words):
+        """Return frequencies of words and phrases per million words of the corpus."""
+        n = self.corpus_size
+        return collections.OrderedDict((w, c * 1000 * 1000 / n) for w, c in self.frequencies(*words).items())
 
     def frequency(self, word, lexical_category=None):
-        """Retrieve a frequency of a word or a phrase."""
+        """Retrieve a frequency of a word or a phrase.
+
+        With `batch_window` set, concurrent lookups of single words are sent
+        together as one batch (see `frequencies`).
+
+        """
         n = word.count(' ')
         if n:
             return self.ngram_frequency(n + 1, word)
+        elif self._batcher is not None and not lexical_category:
+            return self._batcher.frequency(word)
         else:
             return self.word_frequency(tc=word, lexical_category=lexical_category)
 
@@ -84,107 +1348,226 @@ class Client(object):
 
     def word_stats(self, tc='', lemma='', wordform='', lexical_category='', **kwargs):
         """Retrieve statistical info about a word based on the provided params."""
-        params = kwargs
-        if not (tc or lemma or wordform or lexical_category):
-            raise ArgumentError('You need to provide at least one of "tc, lemma, wordform, lexical_category".')
-        if wordform:
-            params['wordform'] = wordform
-        if tc:
-            params['trueCase'] = tc
-        if lemma:
-            params['lemma'] = lemma
-        if lexical_category:
-            params['lexicalCategory'] = lexical_category
-        data = self.request('/stats/frequency/word/en/', params=params)
+        params = _word_params(tc, lemma, wordform, lexical_category, kwargs)
+        data = self.request(WORD_PATH, params=params)
         return data['result']
 
-    def word_stats_list(self, tc='', lemma='', wordform='', lexical_category='', **kwargs):
-        """Retrieve a list of words and their frequencies based on the provided params."""
-        params = kwargs
-        if not (tc or lemma or wordform or lexical_category):
-            raise ArgumentError('You need to provide at least one of "tc, lemma, wordform, lexical_category".')
-        if wordform:
-            params['wordform'] = wordform
-        if tc:
-            params['trueCase'] = tc
-        if lemma:
-            params['lemma'] = lemma
-        if lexical_category:
-            params['lexicalCategory'] = lexical_category
-        data = self.request('/stats/frequency/words/en/', params=params)
-        return data['results']
+    def word_stats_list(self, tc='', lemma='', wordform='', lexical_category='', fields=None, as_frame=False,
+                        **kwargs):
+        """Retrieve a list of words and their frequencies based on the provided params.
 
-    def ngrams(self, n, *, tokens=None, contains=None, **kwargs):
-        """Retrieve a list of ngrams based on the provided params."""
-        params = kwargs
-        if not (tokens or contains):
-            raise ArgumentError('You need to provide one of "tokens, contains".')
-        if tokens and contains:
-            raise ArgumentError('You need to provide either "tokens" or "contains".')
-        if tokens:
-            params['tokens'] = tokens
-        if contains:
-            params['contains'] = contains
-        data = self.request('/stats/frequency/ngrams/en/nmc/{}/'.format(n), params=params)
-        return data['results']
+        With `fields`, e.g. `('trueCase', 'frequency')`, each page is projected to
+        compact records holding only those fields as it arrives (see `record_type`).
+        With `as_frame=True` the results are returned as a columnar `FrequencyFrame`.
+
+        """
+        params = _word_params(tc, lemma, wordform, lexical_category, kwargs)
+        return self._results(WORDS_PATH, params, fields, as_frame)
+
+    def ngrams(self, n, *, tokens=None, contains=None, fields=None, as_frame=False, **kwargs):
+        """Retrieve a list of ngrams based on the provided params (see `word_stats_list` for the options)."""
+        params = _ngram_params(tokens, contains, kwargs)
+        return self._results(NGRAMS_PATH.format(n), params, fields, as_frame)
+
+    def _results(self, path, params, fields, as_frame=False):
+        if as_frame:
+            return FrequencyFrame.from_results(page['results'] for page in self.pages(path, params))
+        if not fields:
+            return self.request(path, params=params)['results']
+        project = _projection(fields)
+        rv = []
+        for page in self.pages(path, params):
+            rv.extend(project(page['results']))
+        return rv
 
     def ngram_frequency(self, n, tokens=None, **kwargs):
         """Return the frequency of an ngram."""
         results = self.ngrams(n, tokens=tokens, **kwargs)
         return results[0]['frequency'] if results else 0
 
+    def iter_word_stats_list(self, tc='', lemma='', wordform='', lexical_category='', offset=0, fields=None,
+                             **kwargs):
+        """Yield words and their frequencies page by page starting at `offset`.
+
+        All results are retrieved unless `length` is given; only one page is kept in memory.
+
+        """
+        params = _word_params(tc, lemma, wordform, lexical_category, kwargs)
+        return self._iter_results(WORDS_PATH, params, offset, fields)
+
+    def iter_ngrams(self, n, *, tokens=None, contains=None, offset=0, fields=None, **kwargs):
+        """Yield ngrams page by page starting at `offset` (see `iter_word_stats_list`)."""
+        params = _ngram_params(tokens, contains, kwargs)
+        return self._iter_results(NGRAMS_PATH.format(n), params, offset, fields)
+
+    def _iter_results(self, path, params, offset, fields=None):
+        params.setdefault('length', -1)
+        if offset:
+            params['offset'] = offset
+        project = _projection(fields) if fields else None
+        for page in self.pages(path, params):
+            yield from (project(page['results']) if project else page['results'])
+
     def request(self, path, params, **kwargs):
-        """Retrieve (possibly recursively) results"""
-        # OD API limit is 100 entries per result
-        length = params.pop('length', 100)
-        # /ngrams/ and /words/ support 'limit';
-        if '/word/' in path:
-            params.pop('limit', 0)
-        else:
-            params['limit'] = min(length, params.get('limit', 100))
-        self.num_queries += 1
-        log.debug('Requesting "{}" {}, {}'.format(path, repr(params), repr(kwargs)))
-        elapsed = (time.time() - self.last_query)
-        wait_time = self.rate - elapsed
-        if wait_time > 0.0:
-            log.debug('Waiting due to rate limit ({})'.format(wait_time))
-            time.sleep(wait_time)
-        self.last_query = time.time()
-        r = requests.get(self.endpoint + path, params=params, headers=self.headers, **kwargs)
-        if r.status_code != 200:
-            lines = [s.strip() for s in r.text.split('\n') if s.strip()]
-            raise RequestError('OD API Error ({}): {}'.format(r.status_code, r.text if not lines else lines[-1]), r)
-        rv = r.json()
-        if 'results' in rv:
-            # lists are limited to 100 elements so query for the rest if necessary
-            limit = rv['metadata']['options']['limit']
-            offset = rv['metadata']['options']['offset']
-            if rv['metadata']['total'] > limit + offset and (length < 0 or limit < length):
+        """Retrieve results joining all the requested pages
+
+        Pass `use_cache=False` in `params` to skip the client's cache for a single call
+        and `priority` to send it in another class of the client's `scheduler`.
+
+        """
+        rv = None
+        for page in self.pages(path, params, **kwargs):
+            if rv is None:
+                rv = page
+            else:
+                rv['results'].extend(page['results'])
+        return rv
+
+    def pages(self, path, params, **kwargs):
+        """Yield the requested pages of results one at a time as they are retrieved"""
+        length, use_cache, priority = _prepare_params(path, params)
+        pages = 0
+        try:
+            while True:
+                rv = self._get(path, params, use_cache, priority, **kwargs)
+                pages += 1
+                yield rv
+                if 'results' not in rv:
+                    return
+                # lists are limited to 100 elements so query for the rest if necessary
+                limit = rv['metadata']['options']['limit']
+                offset = rv['metadata']['options']['offset']
+                if not (rv['metadata']['total'] > limit + offset and (length < 0 or limit < length)):
+                    return
+                length -= limit
                 params['offset'] = offset + limit
-                params['length'] = length - limit
-                rv['results'].extend(self.request(path, params)['results'])
+                params['limit'] = min(length, limit) if length >= 0 else limit
+        finally:
+            self.metrics.record('pages', path=path, pages=pages)
+
+    def _get(self, path, params, use_cache=True, priority=None, **kwargs):
+        """Return a single page of results either from the cache or from the API
+
+        Concurrent calls with the same path and params wait for one request
+        and receive copies of its result.
+
+        """
+        key = self.cache_key(path, params)
+        use_cache = use_cache and self.cache is not None
+        if use_cache:
+            rv = self.cache.get(key)
+            if rv is not None:
+                log.debug('Cache hit "{}" {}'.format(path, repr(params)))
+                self.metrics.record('cache_hit', path=path)
+                return rv
+        if not self.coalesce:
+            return self._fetch(path, params, key if use_cache else None, priority, **kwargs)
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = concurrent.futures.Future()
+                call.waiting = 0
+            else:
+                call.waiting += 1
+                self.stats['coalesced'] += 1
+        if not leader:
+            log.debug('Waiting for the same request "{}" {}'.format(path, repr(params)))
+            return copy.deepcopy(call.result())
+        try:
+            rv = self._fetch(path, params, key if use_cache else None, priority, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            call.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+        # the caller may modify the result so the waiting calls get their own copies
+        call.set_result(copy.deepcopy(rv) if call.waiting else None)
         return rv
 
-    def frequencies(self, *words):
-        bigrams = [w for w in words if w.count(' ') == 1]
-        trigrams = [w for w in words if w.count(' ') == 2]
-        fourgrams = [w for w in words if w.count(' ') == 3]
-        tcs = [w for w in words if ' ' not in w]
-        if len(bigrams) > 10 or len(trigrams) > 10 or len(fourgrams) > 10 or len(tcs) > 10:
-            raise ArgumentError('At most 10 items per query.')
-        word_results = tcs and self.request('/stats/frequency/words/en/', {'trueCases': tcs})['results']
-        bigram_results = bigrams and self.request('/stats/frequency/ngrams/en/nmc/2/', {'tokens': bigrams})['results']
-        trigram_results = trigrams and self.request('/stats/frequency/ngrams/en/nmc/3/', {'tokens': trigrams})['results']
-        fourgram_results = fourgrams and self.request('/stats/frequency/ngrams/en/nmc/4/', {'tokens': fourgrams})['results']
-        rv = collections.defaultdict(int)
-        # collate wordforms by a true case
-        for r in word_results:
-            rv[r['trueCase']] += r['frequency']
-        for r in bigram_results + trigram_results + fourgram_results:
-            compound_word = ' '.join(r['tokens'])
-            rv[compound_word] += r['frequency']
-        # return in the same order as args passed with 0 where word was not present in corpus
-        return collections.OrderedDict({k: rv[k] for k in words})
+    def _fetch(self, path, params, key=None, priority=None, **kwargs):
+        """Request a single page from the API and store it in the cache under `key`"""
+        with self._lock:
+            self.num_queries += 1
+        log.debug('Requesting "{}" {}, {}'.format(path, repr(params), repr(kwargs)))
+        for attempt in range(self.max_retries + 1):
+            headers = self.headers
+            reserved = time.time()
+            if self.credentials is not None:
+                credential, wait_time = self.credentials.acquire()
+                headers = dict(headers, app_id=credential.app_id, app_key=credential.app_key)
+            elif self.scheduler is not None:
+                wait_time = self.scheduler.acquire(priority or self.priority)
+            else:
+                wait_time = self.limiter.acquire()
+            if wait_time > 0.0:
+                self.metrics.record('rate_limit_wait', path=path, seconds=wait_time)
+            start = time.perf_counter()
+            try:
+                r = self.session.get(self.endpoint + path, params=params, headers=headers, **kwargs)
+            except Exception as e:
+                self.metrics.record('error', path=path, error=type(e).__name__)
+                raise
+            self.metrics.record('request', path=path, status=r.status_code,
+                                latency=time.perf_counter() - start, bytes=len(r.content or b''))
+            with self._lock:
+                self.stats['requests'] += 1
+                self._update_pool_stats()
+            if self.credentials is not None:
+                self.credentials.release(credential, r.status_code, _retry_after(r.headers))
+                if self.credentials.retry(r.status_code) and attempt < self.max_retries:
+                    continue
+            if r.status_code == 429 and self.limiter.adaptive and attempt < self.max_retries:
+                self.limiter.throttled(_retry_after(r.headers), reserved)
+                continue
+            break
+        if r.status_code == 200:
+            self.limiter.succeeded(reserved)
+        else:
+            self.metrics.record('error', path=path, error='HTTP {}'.format(r.status_code))
+            raise _request_error(r.status_code, r.text, r)
+        rv = _json_loads(r.content)
+        if key is not None:
+            self.cache.set(key, rv)
+        return rv
+
+    def frequencies(self, *words, workers=4):
+        """Retrieve frequencies of words and phrases in as few requests as possible.
+
+        Any number of words can be passed; they are sent in batches of `BATCH_SIZE`
+        using up to `workers` threads, which share the client's rate limiter.
+        With a cache, the frequency of every word is kept so words already seen
+        in another batch are not requested again.
+
+        """
+        cached = self._cached_frequencies(words)
+        missing = [w for w in words if w not in cached]
+        queries = _frequency_queries(missing)
+        if workers > 1 and len(queries) > 1:
+            with concurrent.futures.ThreadPoolExecutor(min(workers, len(queries))) as executor:
+                responses = list(executor.map(lambda query: self.request(*query)['results'], queries))
+        else:
+            responses = [self.request(path, params)['results'] for path, params in queries]
+        rv = _collate_frequencies(missing, zip((path for path, _ in queries), responses))
+        if self.cache is not None:
+            for word, frequency in rv.items():
+                self.cache.set(self.cache_key(PHRASE_PATH, {'phrase': word}), frequency)
+        rv.update(cached)
+        return collections.OrderedDict((w, rv[w]) for w in words)
+
+    def _cached_frequencies(self, words):
+        rv = {}
+        if self.cache is None:
+            return rv
+        for word in set(words):
+            frequency = self.cache.get(self.cache_key(PHRASE_PATH, {'phrase': word}))
+            if frequency is not None:
+                rv[word] = frequency
+        if rv:
+            self.metrics.record('cache_hit', path=PHRASE_PATH, count=len(rv))
+        return rv
 
     def pmi(self, w1, w2):
         """Calculate word PMI
@@ -195,7 +1578,882 @@ class Client(object):
         """
         n = self.corpus_size
         c_w1_w2, c_w1, c_w2 = self.frequencies(w1 + ' ' + w2, w1, w2).values()
-        if not (c_w1_w2 and c_w1 and c_w2):
-            return 0.0
-        pmi = log2(c_w1_w2) + log2(n) - log2(c_w1) - log2(c_w2)
-        return pmi
+        return _pmi(n, c_w1_w2, c_w1, c_w2)
+
+    def run_batch(self, queries, workers=4, ordered=True):
+        """Run a mix of queries on a thread pool sharing the client's rate limiter.
+
+        Each query is a tuple `(method, args)`, `(method, args, kwargs)` or
+        `(method, kwargs)`, or a dict with the keys `method`, `args` and `kwargs`,
+        where method is one of `BATCH_METHODS`, e.g. `('ngrams', (2, ), {'contains': 'test'})`.
+        Returns a list of `BatchResult` in the order of `queries` or, with
+        `ordered=False`, an iterator yielding them as they complete. A failed or
+        malformed query has its exception in `error` and does not stop the others.
+
+        """
+        calls = list(queries)
+        if workers <= 0:
+            raise ArgumentError('The number of workers has to be more than 0')
+        if ordered:
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                return list(executor.map(self._run_batch_call, enumerate(calls)))
+        return self._iter_batch(calls, workers)
+
+    def _iter_batch(self, calls, workers):
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(self._run_batch_call, call) for call in enumerate(calls)]
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+
+    def _batch_call(self, query):
+        """Return (method, args, kwargs) of a query descriptor"""
+        try:
+            if isinstance(query, dict):
+                name, args, kwargs = query.get('method'), query.get('args', ()), query.get('kwargs', {})
+            elif not isinstance(query, (list, tuple)):
+                raise ArgumentError('Unsupported query {!r}'.format(query))
+            elif len(query) == 3:
+                name, args, kwargs = query
+            elif len(query) == 2 and isinstance(query[1], dict):
+                (name, kwargs), args = query, ()
+            elif len(query) == 2:
+                (name, args), kwargs = query, {}
+            else:
+                raise ArgumentError('Unsupported query {!r}'.format(query))
+            if name not in BATCH_METHODS:
+                raise ArgumentError('Unsupported query method {!r}'.format(name))
+            if isinstance(args, str):
+                args = (args, )
+            return getattr(self, name), tuple(args), dict(kwargs)
+        except (TypeError, ValueError) as e:
+            raise ArgumentError('Unsupported query {!r}: {}'.format(query, e))
+
+    def _run_batch_call(self, item):
+        index, query = item
+        try:
+            method, args, kwargs = self._batch_call(query)
+            return BatchResult(index, query, method(*args, **kwargs), None)
+        except Exception as e:
+            log.debug('Query {!r} failed: {}'.format(query, e))
+            return BatchResult(index, query, None, e)
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client():
+    """Return the client shared by this process, created on first use
+
+    The credentials are read from the environment variables `ODAPI_APP_ID` and
+    `ODAPI_APP_KEY`; `ODAPI_ENDPOINT` and `ODAPI_RPM` optionally set the
+    endpoint and the number of requests per minute.
+
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            try:
+                rpm = float(os.environ.get('ODAPI_RPM', 1))
+            except ValueError:
+                raise ConfigError('ODAPI_RPM has to be a number of requests per minute')
+            _default_client = Client(app_id=os.environ.get('ODAPI_APP_ID'), app_key=os.environ.get('ODAPI_APP_KEY'),
+                                     endpoint=os.environ.get('ODAPI_ENDPOINT'), rpm=rpm)
+        return _default_client
+
+
+class AsyncClient(_BaseClient):
+    """Asynchronous version of `Client` built on aiohttp
+
+    At most `max_concurrency` requests are in flight at a time and all of them
+    share the rate limiter, so many lookups can overlap the network latency
+    while staying within the plan's limits. Use the client as an async context
+    manager or await `close` when done.
+
+    """
+
+    def __init__(self, app_id=None, app_key=None, endpoint=None, headers=None, rpm=1, burst=1,
+                 max_concurrency=10, max_retries=3, backoff_factor=0.5, cache=None, limiter=None,
+                 metrics=None, adaptive=False, metadata=None):
+        super().__init__(app_id, app_key, endpoint, headers, rpm, cache, metrics, metadata)
+        try:
+            import aiohttp
+        except ImportError:
+            raise ConfigError('The asynchronous client requires the package aiohttp')
+        import asyncio
+        if max_concurrency <= 0:
+            raise ConfigError('The number of concurrent requests (`max_concurrency`) has to be more than 0')
+        self._aiohttp = aiohttp
+        self._asyncio = asyncio
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.limiter = limiter or (AdaptiveRateLimiter if adaptive else RateLimiter)(self.rate, burst)
+        self.session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the connections held by the client."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _ensure_session(self):
+        # aiohttp sessions have to be created inside a running event loop
+        if self.session is None:
+            connector = self._aiohttp.TCPConnector(limit=self.max_concurrency)
+            self.session = self._aiohttp.ClientSession(connector=connector)
+            self._semaphore = self._asyncio.Semaphore(self.max_concurrency)
+        return self.session
+
+    async def corpus_size(self):
+        """The size of the corpus kept in the shared `metadata`"""
+        async def compute():
+            return self._compute_corpus_size(await self.word_stats(wordform='the'))
+        return await self.metadata.aget(self.metadata_key('corpus_size'), compute)
+
+    async def frequency(self, word, lexical_category=None):
+        """Retrieve a frequency of a word or a phrase."""
+        n = word.count(' ')
+        if n:
+            return await self.ngram_frequency(n + 1, word)
+        else:
+            return await self.word_frequency(tc=word, lexical_category=lexical_category)
+
+    async def word_frequency(self, tc='', lemma='', wordform='', lexical_category=''):
+        """Retrieve a frequency of a given word based on the provided params."""
+        result = await self.word_stats(tc, lemma, wordform, lexical_category)
+        return result['frequency']
+
+    async def word_stats(self, tc='', lemma='', wordform='', lexical_category='', **kwargs):
+        """Retrieve statistical info about a word based on the provided params."""
+        params = _word_params(tc, lemma, wordform, lexical_category, kwargs)
+        data = await self.request(WORD_PATH, params=params)
+        return data['result']
+
+    async def word_stats_list(self, tc='', lemma='', wordform='', lexical_category='', fields=None, **kwargs):
+        """Retrieve a list of words and their frequencies based on the provided params."""
+        params = _word_params(tc, lemma, wordform, lexical_category, kwargs)
+        data = await self.request(WORDS_PATH, params=params)
+        return _projection(fields)(data['results']) if fields else data['results']
+
+    async def ngrams(self, n, *, tokens=None, contains=None, fields=None, **kwargs):
+        """Retrieve a list of ngrams based on the provided params."""
+        params = _ngram_params(tokens, contains, kwargs)
+        data = await self.request(NGRAMS_PATH.format(n), params=params)
+        return _projection(fields)(data['results']) if fields else data['results']
+
+    async def ngram_frequency(self, n, tokens=None, **kwargs):
+        """Return the frequency of an ngram."""
+        results = await self.ngrams(n, tokens=tokens, **kwargs)
+        return results[0]['frequency'] if results else 0
+
+    async def request(self, path, params, **kwargs):
+        """Retrieve results fetching the remaining pages concurrently once the total is known"""
+        length, use_cache, _ = _prepare_params(path, params)
+        rv = await self._get(path, params, use_cache, **kwargs)
+        pages = []
+        if 'results' in rv:
+            pages = [dict(params, offset=offset, limit=limit) for offset, limit in _remaining_pages(rv, length)]
+            responses = await self._asyncio.gather(*(self._get(path, page, use_cache, **kwargs) for page in pages))
+            for response in responses:
+                rv['results'].extend(response['results'])
+        self.metrics.record('pages', path=path, pages=len(pages) + 1)
+        return rv
+
+    async def _get(self, path, params, use_cache=True, **kwargs):
+        """Return a single page of results either from the cache or from the API"""
+        key = None
+        if self.cache is not None and use_cache:
+            key = self.cache_key(path, params)
+            rv = self.cache.get(key)
+            if rv is not None:
+                log.debug('Cache hit "{}" {}'.format(path, repr(params)))
+                self.metrics.record('cache_hit', path=path)
+                return rv
+        session = self._ensure_session()
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                reserved = time.time()
+                wait_time = self.limiter.reserve()
+                if wait_time > 0.0:
+                    self.metrics.record('rate_limit_wait', path=path, seconds=wait_time)
+                    await self._asyncio.sleep(wait_time)
+                self.num_queries += 1
+                log.debug('Requesting "{}" {}, {}'.format(path, repr(params), repr(kwargs)))
+                start = time.perf_counter()
+                try:
+                    async with session.get(self.endpoint + path, params=_query_items(params),
+                                           headers=self.headers, **kwargs) as r:
+                        self.stats['requests'] += 1
+                        body = await r.read()
+                except Exception as e:
+                    self.metrics.record('error', path=path, error=type(e).__name__)
+                    raise
+                self.metrics.record('request', path=path, status=r.status,
+                                    latency=time.perf_counter() - start, bytes=len(body))
+                text = body.decode(r.get_encoding())
+                if r.status == 429 and self.limiter.adaptive and attempt < self.max_retries:
+                    self.limiter.throttled(_retry_after(r.headers), reserved)
+                    continue
+                if r.status in RETRY_STATUSES and attempt < self.max_retries:
+                    retry_after = _retry_after(r.headers)
+                    if retry_after is None:
+                        retry_after = self.backoff_factor * (2 ** attempt)
+                    await self._asyncio.sleep(retry_after)
+                    continue
+                if r.status == 200:
+                    self.limiter.succeeded(reserved)
+                if r.status != 200:
+                    self.metrics.record('error', path=path, error='HTTP {}'.format(r.status))
+                    raise _request_error(r.status, text, r)
+                break
+        rv = _json_loads(body)
+        if key is not None:
+            self.cache.set(key, rv)
+        return rv
+
+    async def frequencies(self, *words):
+        """Retrieve frequencies of any number of words and phrases requesting the batches concurrently."""
+        queries = _frequency_queries(words)
+        responses = await self._asyncio.gather(*(self.request(path, params) for path, params in queries))
+        return _collate_frequencies(words, [(path, data['results']) for (path, _), data in zip(queries, responses)])
+
+    async def pmi(self, w1, w2):
+        """Calculate word PMI (see `Client.pmi`)"""
+        n = await self.corpus_size()
+        c_w1_w2, c_w1, c_w2 = (await self.frequencies(w1 + ' ' + w2, w1, w2)).values()
+        return _pmi(n, c_w1_w2, c_w1, c_w2)
+
+
+class RecordedResponse(object):
+    """A response read from a traffic log by `ReplaySession`"""
+
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.headers = headers or {}
+
+    def json(self):
+        return _json_loads(self.content)
+
+
+class RecordingSession(object):
+    """Session recording every request and its response to a traffic log
+
+    Requests are sent with `session`; use `attach` to wrap the session a
+    client creates with its own pool size and retries. Each line of the log
+    (gzipped when `path` ends with .gz) holds the time of the request since the
+    start of the recording, the path and params, the status, the Retry-After
+    header, the latency and the body of the response; the credentials are not
+    recorded. Retries made inside `session` are not logged separately.
+
+    """
+
+    def __init__(self, path, session):
+        self.path = path
+        self.session = session
+        self._file = _open_log(path, 'w')
+        self._lock = threading.Lock()
+        self._start = None
+
+    @classmethod
+    def attach(cls, client, path):
+        """Record the traffic of `client` to `path` and return the recording session."""
+        client.session = recording = cls(path, client.session)
+        return recording
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, url, params=None, **kwargs):
+        start = time.perf_counter()
+        r = self.session.get(url, params=params, **kwargs)
+        latency = time.perf_counter() - start
+        headers = {'Retry-After': r.headers['Retry-After']} if 'Retry-After' in r.headers else {}
+        with self._lock:
+            if self._start is None:
+                self._start = start
+            self._file.write(json.dumps({
+                't': round(start - self._start, 6), 'path': _url_path(url), 'params': params or {},
+                'status': r.status_code, 'headers': headers, 'latency': round(latency, 6), 'body': r.text,
+            }, separators=(',', ':')) + '\n')
+        return r
+
+    def close(self):
+        """Close the log and the underlying session."""
+        with self._lock:
+            self._file.close()
+        self.session.close()
+
+
+class ReplaySession(object):
+    """Session answering requests from a traffic log written by `RecordingSession`
+
+    Responses are looked up by the path of the URL (without the host) and the
+    params of the request; repeated
+    requests get the recorded responses in turn (and the last one once they
+    run out). Requests missing from the log get a 404 response. With `speed`,
+    every response is delayed by its recorded latency divided by `speed`
+    (1.0 is the original speed); without it responses are immediate.
+
+    """
+
+    def __init__(self, path, speed=None):
+        if speed is not None and speed <= 0:
+            raise ConfigError('The replay speed has to be more than 0')
+        self.speed = speed
+        self.entries = read_traffic(path)
+        self._responses = collections.defaultdict(collections.deque)
+        for entry in self.entries:
+            self._responses[_request_key(entry['path'], entry['params'])].append(entry)
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, **kwargs):
+        with self._lock:
+            responses = self._responses.get(_request_key(_url_path(url), params or {}))
+            entry = (responses.popleft() if len(responses) > 1 else responses[0]) if responses else None
+        if entry is None:
+            return RecordedResponse(404, 'Request not found in the traffic log')
+        if self.speed:
+            time.sleep(entry['latency'] / self.speed)
+        return RecordedResponse(entry['status'], entry['body'], entry['headers'])
+
+    def close(self):
+        pass
+
+
+def read_traffic(path):
+    """Return the entries of a traffic log written by `RecordingSession`"""
+    with _open_log(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay_traffic(client, path, speed=1.0, workers=8):
+    """Send the requests of a traffic log through `client` at their recorded times divided by `speed`
+
+    The pages are requested with `Client.request` from up to `workers` threads,
+    so they go through the cache, the rate limiter and the retries of the
+    client. Returns a `BatchResult` (with the response or the error) for every
+    entry of the log in order. Use `speed=None` to send them as fast as possible.
+
+    """
+    entries = read_traffic(path)
+    prefix = _url_path(client.endpoint).rstrip('/')
+    start = time.perf_counter()
+
+    def send(item):
+        index, entry = item
+        if speed:
+            delay = entry['t'] / speed - (time.perf_counter() - start)
+            if delay > 0.0:
+                time.sleep(delay)
+        path = entry['path'][len(prefix):] if entry['path'].startswith(prefix) else entry['path']
+        query = (path, dict(entry['params']))
+        # one call per recorded page
+        query[1].setdefault('length', query[1].get('limit', 100))
+        try:
+            return BatchResult(index, query, client.request(*query), None)
+        except Exception as e:
+            return BatchResult(index, query, None, e)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(send, enumerate(entries)))
+
+
+class CrawlJob(object):
+    """Resumable crawl of a list of words (`n=None`) or ngrams of size `n`
+
+    `query` holds the arguments of `Client.iter_word_stats_list` or
+    `Client.iter_ngrams`. Every page is appended to the JSONL checkpoint at
+    `path` as soon as it arrives, so after a crash or a used-up quota `run`
+    continues from the first result that has not been saved.
+
+    """
+
+    def __init__(self, path, n=None, **query):
+        self.path = path
+        self.n = n
+        self.query = query
+
+    def __repr__(self):
+        return 'CrawlJob({!r}, n={!r}, **{!r})'.format(self.path, self.n, self.query)
+
+    def _pages(self, repair=False):
+        """Yield the saved pages skipping an incomplete last line
+
+        The line may still be being written by a worker, so only `run` (with
+        `repair=True`) cuts it off the file.
+
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+' if repair else 'rb') as f:
+            position = 0
+            for line in f:
+                try:
+                    page = json.loads(line) if line.endswith(b'\n') else None
+                except ValueError:
+                    page = None
+                if page is None:
+                    if repair:
+                        log.warning('Dropping an incomplete page from "{}"'.format(self.path))
+                        f.truncate(position)
+                    return
+                position += len(line)
+                yield page
+
+    def progress(self):
+        """Return the offset of the next result, the total number of results (or None) and whether it is done."""
+        offset, total = self.query.get('offset', 0), None
+        for page in self._pages():
+            offset, total = page['offset'] + len(page['results']), page['total']
+        length = self.query.get('length', -1)
+        end = total if length < 0 or total is None else min(total, self.query.get('offset', 0) + length)
+        return offset, total, end is not None and offset >= end
+
+    def results(self):
+        """Yield the saved results."""
+        for page in self._pages():
+            yield from page['results']
+
+    def run(self, client):
+        """Crawl the remaining pages with `client` and return the number of fetched results."""
+        for _ in self._pages(repair=True):
+            pass
+        offset, total, done = self.progress()
+        if done:
+            return 0
+        params = dict(self.query)
+        length = params.pop('length', -1)
+        if length >= 0:
+            length -= offset - params.get('offset', 0)
+        params['offset'], params['length'] = offset, length
+        if self.n is None:
+            path = WORDS_PATH
+            params = _word_params(params.pop('tc', ''), params.pop('lemma', ''), params.pop('wordform', ''),
+                                  params.pop('lexical_category', ''), params)
+        else:
+            path = NGRAMS_PATH.format(self.n)
+            params = _ngram_params(params.pop('tokens', None), params.pop('contains', None), params)
+        fetched = 0
+        with open(self.path, 'a') as f:
+            for page in client.pages(path, params):
+                results = page['results']
+                f.write(json.dumps({'offset': page['metadata']['options']['offset'],
+                                    'total': page['metadata']['total'], 'results': results}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+                fetched += len(results)
+                if not results:
+                    break
+        return fetched
+
+
+def _run_crawl_job(job, client_kwargs):
+    with Client(**client_kwargs) as client:
+        try:
+            fetched = job.run(client)
+        except Exception as e:
+            log.warning('{!r} stopped: {}'.format(job, e))
+            return {'job': job, 'fetched': 0, 'done': False, 'error': repr(e)}
+    return {'job': job, 'fetched': fetched, 'done': job.progress()[2], 'error': None}
+
+
+def run_crawl_jobs(jobs, client_kwargs, processes=4):
+    """Run crawl shards in parallel worker processes, each with its own `Client(**client_kwargs)`
+
+    Share a `FileRateLimiter` through `client_kwargs['limiter']` to keep the
+    workers within the limits of one API key. Returns a summary of every job;
+    jobs that failed can be resumed by running them again.
+
+    """
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(_run_crawl_job, job, client_kwargs) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def build_snapshot(client, path, word_queries=(), ngram_queries=()):
+    """Crawl result sets through `client` and save their frequencies as a snapshot
+
+    `word_queries` are dicts of arguments of `Client.iter_word_stats_list` (wordforms
+    are collated by their true case) and `ngram_queries` are pairs `(n, kwargs)`
+    of arguments of `Client.iter_ngrams`. Returns the number of saved entries.
+
+    """
+    counts = collections.defaultdict(int)
+    for kwargs in word_queries:
+        for r in client.iter_word_stats_list(**kwargs):
+            counts[r['trueCase']] += r['frequency']
+    for n, kwargs in ngram_queries:
+        for r in client.iter_ngrams(n, **kwargs):
+            counts[' '.join(r['tokens'])] += r['frequency']
+    write_snapshot(path, counts, corpus_size=client.corpus_size)
+    return len(counts)
+
+
+def write_snapshot(path, counts, corpus_size=None):
+    """Write a mapping of words and phrases to frequencies in the snapshot format
+
+    The file consists of a header, an array of n + 1 offsets of the keys,
+    an array of n counts and the UTF-8 encoded keys sorted bytewise.
+
+    """
+    keys = sorted(k.encode('utf-8') for k in counts)
+    offsets = array.array('Q', [0])
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    frequencies = array.array('q', (counts[key.decode('utf-8')] for key in keys))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+        frequencies.byteswap()
+    with open(path, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(keys), offsets[-1], corpus_size or 0.0))
+        f.write(offsets.tobytes())
+        f.write(frequencies.tobytes())
+        for key in keys:
+            f.write(key)
+
+
+class Snapshot(object):
+    """Read-only memory-mapped mapping of words and phrases to frequencies written by `write_snapshot`"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, blob_size, corpus_size = SNAPSHOT_HEADER.unpack_from(self._mmap)
+        if magic != SNAPSHOT_MAGIC or sys.byteorder != 'little':
+            self._mmap.close()
+            raise ConfigError('"{}" is not a snapshot readable on this platform'.format(path))
+        self.corpus_size = corpus_size or None
+        view = memoryview(self._mmap)
+        start = SNAPSHOT_HEADER.size
+        self._offsets = view[start:start + 8 * (n + 1)].cast('Q')
+        start += 8 * (n + 1)
+        self._counts = view[start:start + 8 * n].cast('q')
+        start += 8 * n
+        self._keys = view[start:start + blob_size]
+        self._n = n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for view in (self._offsets, self._counts, self._keys):
+            view.release()
+        self._mmap.close()
+
+    def __len__(self):
+        return self._n
+
+    def _key(self, i):
+        return self._keys[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+    def _index(self, key):
+        key = key.encode('utf-8')
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self._n and self._key(lo) == key else -1
+
+    def __contains__(self, key):
+        return self._index(key) >= 0
+
+    def __getitem__(self, key):
+        i = self._index(key)
+        if i < 0:
+            raise KeyError(key)
+        return self._counts[i]
+
+    def get(self, key, default=None):
+        i = self._index(key)
+        return self._counts[i] if i >= 0 else default
+
+    def items(self):
+        for i in range(self._n):
+            yield self._key(i).decode('utf-8'), self._counts[i]
+
+
+class SnapshotClient(_CollocationScores):
+    """Answer frequency queries from a snapshot with an optional fall-through to a live client
+
+    Words missing from the snapshot have frequency 0 unless `client` is given,
+    in which case they are retrieved from the API.
+
+    """
+
+    def __init__(self, path, client=None):
+        self.snapshot = Snapshot(path)
+        self.client = client
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.snapshot.close()
+
+    @property
+    def corpus_size(self):
+        if self.snapshot.corpus_size is None and self.client is not None:
+            return self.client.corpus_size
+        return self.snapshot.corpus_size
+
+    def frequency(self, word, lexical_category=None):
+        """Retrieve a frequency of a word or a phrase."""
+        if lexical_category:
+            if self.client is None:
+                raise ArgumentError('Snapshots do not distinguish lexical categories.')
+            return self.client.frequency(word, lexical_category=lexical_category)
+        return self.frequencies(word)[word]
+
+    def frequencies(self, *words):
+        """Retrieve frequencies of words and phrases."""
+        rv = collections.OrderedDict()
+        missing = []
+        for w in words:
+            count = self.snapshot.get(w)
+            if count is None:
+                missing.append(w)
+            rv[w] = count or 0
+        self.misses += len(missing)
+        if missing and self.client is not None:
+            rv.update(self.client.frequencies(*missing))
+        return rv
+
+    def pmi(self, w1, w2):
+        """Calculate word PMI (see `Client.pmi`)"""
+        c_w1_w2, c_w1, c_w2 = self.frequencies(w1 + ' ' + w2, w1, w2).values()
+        return _pmi(self.corpus_size, c_w1_w2, c_w1, c_w2)
+
+
+def _word_params(tc, lemma, wordform, lexical_category, params):
+    """Add the word selection arguments to `params` using the API names"""
+    if not (tc or lemma or wordform or lexical_category):
+        raise ArgumentError('You need to provide at least one of "tc, lemma, wordform, lexical_category".')
+    if wordform:
+        params['wordform'] = wordform
+    if tc:
+        params['trueCase'] = tc
+    if lemma:
+        params['lemma'] = lemma
+    if lexical_category:
+        params['lexicalCategory'] = lexical_category
+    return params
+
+
+def _ngram_params(tokens, contains, params):
+    """Add the ngram selection arguments to `params`"""
+    if not (tokens or contains):
+        raise ArgumentError('You need to provide one of "tokens, contains".')
+    if tokens and contains:
+        raise ArgumentError('You need to provide either "tokens" or "contains".')
+    if tokens:
+        params['tokens'] = tokens
+    if contains:
+        params['contains'] = contains
+    return params
+
+
+def _prepare_params(path, params):
+    """Remove the client-only options from `params` and set the page limit
+
+    Returns the number of requested results, whether the cache can be used
+    and the priority class of the request.
+
+    """
+    # OD API limit is 100 entries per result
+    length = params.pop('length', 100)
+    use_cache = params.pop('use_cache', True)
+    priority = params.pop('priority', None)
+    # /ngrams/ and /words/ support 'limit';
+    if '/word/' in path:
+        params.pop('limit', 0)
+    elif length >= 0:
+        params['limit'] = min(length, params.get('limit', 100))
+    else:
+        params['limit'] = params.get('limit', 100)
+    return length, use_cache, priority
+
+
+def _remaining_pages(rv, length):
+    """Return (offset, limit) of the pages following the page `rv` up to `length` results"""
+    limit = rv['metadata']['options']['limit']
+    offset = rv['metadata']['options']['offset']
+    total = rv['metadata']['total']
+    end = total if length < 0 else min(total, offset + length)
+    return [(start, min(limit, end - start)) for start in range(offset + limit, end, limit)]
+
+
+def _query_items(params):
+    """Flatten `params` into (key, value) pairs repeating keys of list values"""
+    items = []
+    for key, value in params.items():
+        for v in (value if isinstance(value, (list, tuple)) else [value]):
+            items.append((key, str(v).lower() if isinstance(v, bool) else str(v)))
+    return items
+
+
+def _request_error(status_code, text, response):
+    lines = [s.strip() for s in text.split('\n') if s.strip()]
+    return RequestError('OD API Error ({}): {}'.format(status_code, text if not lines else lines[-1]), response)
+
+
+def _chunks(items, size=BATCH_SIZE):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _frequency_queries(words):
+    """Return (path, params) of the queries retrieving frequencies of `words`
+
+    Repeated words are requested once and every ngram size is split
+    into queries of at most `BATCH_SIZE` items.
+
+    """
+    unique = list(collections.OrderedDict.fromkeys(words))
+    queries = [(WORDS_PATH, {'trueCases': chunk}) for chunk in _chunks([w for w in unique if ' ' not in w])]
+    for n in (2, 3, 4):
+        items = [w for w in unique if w.count(' ') == n - 1]
+        queries.extend((NGRAMS_PATH.format(n), {'tokens': chunk}) for chunk in _chunks(items))
+    return queries
+
+
+def _collate_frequencies(words, responses):
+    """Sum the frequencies in `responses` ((path, results) pairs) by the words they belong to"""
+    rv = collections.defaultdict(int)
+    for path, results in responses:
+        for r in results:
+            if path == WORDS_PATH:
+                # collate wordforms by a true case
+                rv[r['trueCase']] += r['frequency']
+            else:
+                rv[' '.join(r['tokens'])] += r['frequency']
+    # return in the same order as args passed with 0 where word was not present in corpus
+    return collections.OrderedDict({k: rv[k] for k in words})
+
+
+def _tokenize(text):
+    return re.findall(r"\w+(?:['’]\w+)*", text)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ConfigError('Vectorised scores require the package numpy')
+    return numpy
+
+
+def _collocation_phrases(pairs):
+    """Return the unigrams and bigrams needed to score `pairs` without repetitions"""
+    phrases = collections.OrderedDict()
+    for w1, w2 in pairs:
+        phrases[w1 + ' ' + w2] = phrases[w1] = phrases[w2] = None
+    return list(phrases)
+
+
+def _collocation_scores(n, c_w1_w2, c_w1, c_w2):
+    """Calculate PMI, NPMI and Dunning's log-likelihood ratio from arrays of counts"""
+    np = _numpy()
+    n = float(n)
+    c12, c1, c2 = (np.asarray(c, dtype=np.float64) for c in (c_w1_w2, c_w1, c_w2))
+    marginals = (c1 > 0) & (c2 > 0)
+    observed = marginals & (c12 > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pmi = np.where(observed, np.log2(c12) + np.log2(n) - np.log2(c1) - np.log2(c2), 0.0)
+        npmi = np.where(observed & (c12 < n), pmi / -np.log2(c12 / n), 0.0)
+        # 2x2 contingency table of (w1, not w1) x (w2, not w2)
+        cells = (
+            (c12, c1 * c2 / n),
+            (c1 - c12, c1 * (n - c2) / n),
+            (c2 - c12, (n - c1) * c2 / n),
+            (n - c1 - c2 + c12, (n - c1) * (n - c2) / n),
+        )
+        llr = 2.0 * sum(np.where((k > 0) & (e > 0), k * np.log(k / e), 0.0) for k, e in cells)
+    return Collocations(pmi, npmi, np.where(marginals, llr, 0.0))
+
+
+@functools.lru_cache(maxsize=None)
+def record_type(fields):
+    """Return the compact record type (a named tuple) holding `fields` of results"""
+    try:
+        return collections.namedtuple('Result', fields)
+    except ValueError as e:
+        raise ArgumentError('Unsupported fields {!r}: {}'.format(fields, e))
+
+
+def _projection(fields):
+    """Return a function converting a list of results to records with only `fields`"""
+    fields = (fields, ) if isinstance(fields, str) else tuple(fields)
+    make = record_type(fields)._make
+    getters = [operator.itemgetter(f) for f in fields]
+
+    def project(results):
+        try:
+            return [make([get(r) for get in getters]) for r in results]
+        except KeyError:
+            return [make([r.get(f) for f in fields]) for r in results]
+    return project
+
+
+def _open_log(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _url_path(url):
+    from urllib.parse import urlsplit
+    return urlsplit(url).path
+
+
+def _request_key(path, params):
+    params = {k: list(v) if isinstance(v, (list, tuple)) else v for k, v in params.items()}
+    return json.dumps([path.rstrip('/'), params], sort_keys=True)
+
+
+def _retry_after(headers):
+    """Return the number of seconds in the Retry-After header or None"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    import email.utils
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _pmi(n, c_w1_w2, c_w1, c_w2):
+    if not (c_w1_w2 and c_w1 and c_w2):
+        return 0.0
+    return log2(c_w1_w2) + log2(n) - log2(c_w1) - log2(c_w2)
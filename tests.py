@@ -1,18 +1,784 @@
+import asyncio
+import concurrent.futures
+import json
+import os
 import requests
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
 import unittest
 import unittest.mock
 
-from odapi_client import Client, OupClientError, RequestError
+from benchmarks.mock_server import MockServer
+from odapi_client import (Client, AsyncClient, OupClientError, RequestError, MemoryCache, SqliteCache,
+                          RateLimiter, FileRateLimiter, QuotaExceededError, AdaptiveRateLimiter, Snapshot, SnapshotClient,
+                          build_snapshot, write_snapshot, Metrics, FrequencyFrame, CorpusMetadata, CrawlJob,
+                          run_crawl_jobs, ArgumentError, ConfigError, default_client,
+                          PriorityScheduler, CredentialPool,
+                          RecordingSession, ReplaySession, read_traffic, replay_traffic)
 
 
 class TestClient(unittest.TestCase):
 
     def test_request_error(self):
-        with unittest.mock.patch('odapi_client.requests') as requests_mock:
-            requests_mock.get().status_code = 400
-            client = Client(app_id='hoover', app_key='craft')
-            self.assertRaises(RequestError, client.request, '/', {})
+        session = unittest.mock.MagicMock()
+        session.get.return_value = unittest.mock.MagicMock(status_code=400, headers={}, text='Bad request')
+        client = Client(app_id='hoover', app_key='craft', session=session)
+        self.assertRaises(RequestError, client.request, '/', {})
+        session.get.assert_called_once()
+
+    def test_session_is_reused_and_closed(self):
+        session = unittest.mock.MagicMock()
+        session.get().status_code = 200
+        session.get().content = b'{"result": {"frequency": 3}}'
+        with Client(app_id='hoover', app_key='craft', rpm=1000, session=session) as client:
+            client.word_frequency(tc='a')
+            client.word_frequency(tc='b')
+        self.assertEqual(client.stats['requests'], 2)
+        session.close.assert_called_once_with()
+
+    def test_pool_stats_count_reused_connections(self):
+        client = Client(app_id='hoover', app_key='craft', pool_size=2)
+        adapter = client.session.get_adapter('https://')
+        self.assertEqual(adapter._pool_maxsize, 2)
+        self.assertEqual(adapter.max_retries.status_forcelist, (429, 500, 502, 503, 504))
+        pool = adapter.poolmanager.connection_from_host('od-api.oxforddictionaries.com', 443, 'https')
+        pool.num_connections, pool.num_requests = 1, 5
+        client._update_pool_stats()
+        self.assertEqual(client.stats['pool_reused'], 4)
+        client.close()
+
+    def test_http_stack_is_imported_on_first_request(self):
+        code = ('import sys, odapi_client; client = odapi_client.Client(app_id="a", app_key="b"); '
+                'assert "requests" not in sys.modules; client.session; assert "requests" in sys.modules')
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    def test_default_client_is_shared(self):
+        env = {'ODAPI_APP_ID': 'hoover', 'ODAPI_APP_KEY': 'craft', 'ODAPI_RPM': '30'}
+        with unittest.mock.patch.dict(os.environ, env), unittest.mock.patch('odapi_client._default_client', None):
+            client = default_client()
+            self.assertIs(default_client(), client)
+            self.assertEqual(client.headers['app_id'], 'hoover')
+            self.assertEqual(client.rate, 1 / 30)
+        with unittest.mock.patch.dict(os.environ, {'ODAPI_APP_KEY': ''}), \
+                unittest.mock.patch('odapi_client._default_client', None):
+            self.assertRaises(ConfigError, default_client)
+
+
+def fake_response(path, params):
+    """Return a mocked response of the API with a frequency equal to the length of each word"""
+    response = unittest.mock.MagicMock(status_code=200)
+    total = None
+    if 'contains' in params:
+        offset, limit, total = params.get('offset', 0), params['limit'], 250
+        results = [{'tokens': [params['contains'], str(i)], 'frequency': i}
+                   for i in range(offset, min(offset + limit, total))]
+    elif 'lemma' in params and '/words/' in path:
+        results = [{'trueCase': params['lemma'], 'frequency': 3}, {'trueCase': params['lemma'], 'frequency': 4}]
+    elif 'trueCases' in params:
+        results = [{'trueCase': w, 'frequency': len(w)} for w in params['trueCases']]
+    elif 'tokens' in params:
+        tokens = params['tokens'] if isinstance(params['tokens'], list) else [params['tokens']]
+        results = [{'tokens': w.split(' '), 'frequency': len(w)} for w in tokens]
+    else:
+        response.content = json.dumps({'result': {'frequency': 1, 'normalizedFrequency': 1.0}}).encode()
+        return response
+    options = {'limit': params.get('limit', 100), 'offset': params.get('offset', 0)}
+    response.content = json.dumps({'metadata': {'total': total or len(results), 'options': options},
+                                   'results': results}).encode()
+    return response
+
+
+def fake_session():
+    session = unittest.mock.MagicMock()
+    session.get.side_effect = lambda url, params, **kwargs: fake_response(url, params)
+    return session
+
+
+class TestFrequencies(unittest.TestCase):
+
+    def test_any_number_of_words_is_split_into_batches(self):
+        client = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session())
+        words = ['w{}'.format(i) for i in range(25)] + ['a b{}'.format(i) for i in range(12)]
+        rv = client.frequencies(*(words + words[:5]), workers=3)
+        self.assertEqual(list(rv), words)
+        self.assertEqual(list(rv.values()), [len(w) for w in words])
+        sent = [call[1]['params'] for call in client.session.get.call_args_list]
+        self.assertEqual(sorted(len(p.get('trueCases') or p['tokens']) for p in sent), [2, 5, 10, 10, 10])
+
+    def test_sentence_ngrams_are_requested_once(self):
+        client = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session(), cache=MemoryCache())
+        client.corpus_size = 1000
+        lattice = client.sentence_ngram_frequencies('The cat sat on the mat, the cat sat.', max_n=3)
+        self.assertEqual(lattice.tokens, ('The', 'cat', 'sat', 'on', 'the', 'mat', 'the', 'cat', 'sat'))
+        sent = [call[1]['params'] for call in client.session.get.call_args_list]
+        # the batches are sent from a thread pool in any order
+        self.assertEqual(sorted(len(p.get('trueCases') or p['tokens']) for p in sent), [6, 7, 7])
+        self.assertEqual(lattice.frequency(1, 2), len('cat sat'))
+        self.assertEqual([phrase for _, phrase, _ in lattice.spans(3)][-2:], ['mat the cat', 'the cat sat'])
+        self.assertEqual(lattice.probability(2, 2), len('cat sat') / len('cat'))
+        self.assertEqual(lattice.probability(0), len('The') / 1000)
+        self.assertRaises(ArgumentError, lattice.frequency, 8, 2)
+        lattice = client.sentence_ngram_frequencies('the cat sat down', max_n=3)
+        sent = [call[1]['params'].get('trueCases') or call[1]['params']['tokens']
+                for call in client.session.get.call_args_list[3:]]
+        self.assertEqual(sorted(sent), [['cat sat down'], ['down'], ['sat down']])
+        self.assertEqual(lattice['the cat sat'], len('the cat sat'))
+
+
+class TestCoalescing(unittest.TestCase):
+
+    def test_concurrent_identical_requests_are_sent_once(self):
+        release = threading.Event()
+        session = fake_session()
+        session.get.side_effect = lambda url, params, **kwargs: release.wait() and fake_response(url, params)
+        client = Client(app_id='hoover', app_key='craft', rpm=1000, session=session)
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(client.word_stats, tc='the') for _ in range(4)]
+            while client.stats['coalesced'] < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [f.result() for f in futures]
+        self.assertEqual(session.get.call_count, 1)
+        self.assertEqual(results, [results[0]] * 4)
+        self.assertEqual(len(set(map(id, results))), 4)
+
+    def test_single_word_lookups_are_batched(self):
+        client = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session(), batch_window=0.05)
+        with concurrent.futures.ThreadPoolExecutor(3) as executor:
+            results = list(executor.map(client.frequency, ['a', 'bb', 'ccc']))
+        self.assertEqual(results, [1, 2, 3])
+        self.assertEqual(client.num_queries, 1)
+        self.assertEqual(client.session.get.call_args[1]['params'], {'trueCases': ['a', 'bb', 'ccc'], 'limit': 100})
+
+
+class TestRunBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session())
+        self.queries = [
+            ('word_stats', {'tc': 'the'}),
+            ('ngrams', (2, ), {'contains': 'test', 'length': 150}),
+            {'method': 'frequency', 'args': ['a b']},
+            ('word_stats', {}),
+            ('frequencies', ['a', 'bb']),
+        ]
+
+    def test_results_in_order_with_errors_per_item(self):
+        results = self.client.run_batch(self.queries, workers=3)
+        self.assertEqual([r.index for r in results], list(range(5)))
+        self.assertEqual(results[0].result['frequency'], 1)
+        self.assertEqual(len(results[1].result), 150)
+        self.assertEqual(results[2].result, 3)
+        self.assertIsInstance(results[3].error, OupClientError)
+        self.assertEqual(list(results[4].result.values()), [1, 2])
+        self.assertEqual(results[4].query, self.queries[4])
+
+    def test_results_as_completed(self):
+        results = list(self.client.run_batch(self.queries, workers=3, ordered=False))
+        self.assertEqual(sorted(r.index for r in results), list(range(5)))
+        self.assertEqual(sum(r.error is not None for r in results), 1)
+
+    def test_malformed_queries_fail_per_item(self):
+        results = self.client.run_batch([('close', ()), 7, 'bad', 'ab', ('word_stats', {'tc': 'the'})])
+        self.assertEqual([type(r.error) for r in results], [ArgumentError] * 4 + [type(None)])
+        self.assertEqual(results[4].result['frequency'], 1)
+
+
+class TestPagination(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session())
+
+    def test_request_joins_pages(self):
+        results = self.client.ngrams(2, contains='test', length=210)
+        self.assertEqual([r['frequency'] for r in results], list(range(210)))
+        self.assertEqual(self.client.num_queries, 3)
+
+    def test_iter_ngrams_fetches_pages_lazily(self):
+        results = self.client.iter_ngrams(2, contains='test')
+        self.assertEqual(next(results)['frequency'], 0)
+        self.assertEqual(self.client.num_queries, 1)
+        self.assertEqual(len(list(results)), 249)
+        self.assertEqual(self.client.num_queries, 3)
+
+    def test_results_projected_to_records(self):
+        results = self.client.ngrams(2, contains='test', length=150, fields=('tokens', 'frequency'))
+        self.assertEqual(len(results), 150)
+        self.assertEqual(results[3], (['test', '3'], 3))
+        self.assertEqual(results[3].frequency, 3)
+        records = list(self.client.iter_ngrams(2, contains='test', offset=248, fields=['frequency', 'trueCase']))
+        self.assertEqual(records, [(248, None), (249, None)])
+        self.assertRaises(OupClientError, self.client.ngrams, 2, contains='test', fields=['not a name'])
+
+    def test_results_as_frame(self):
+        frame = self.client.ngrams(2, contains='test', length=150, as_frame=True)
+        self.assertEqual(len(frame), 150)
+        self.assertEqual(frame.words[7], 'test 7')
+        self.assertEqual(frame.frequency.dtype.name, 'int64')
+        top = frame.top_k(3)
+        self.assertEqual(list(top.words), ['test 149', 'test 148', 'test 147'])
+        self.assertEqual(len(FrequencyFrame.from_results([])), 0)
+
+    def test_frame_bands(self):
+        frame = FrequencyFrame(['a', 'b', 'c', 'd', 'e'], [0, 1, 2, 3, 4], [0.0, 0.005, 0.01, 5.0, 1000.0])
+        self.assertEqual(list(frame.bands()), [1, 2, 3, 5, 8])
+        self.assertEqual(list(frame[frame.bands() > 2].words), ['c', 'd', 'e'])
+        frame = FrequencyFrame.from_mapping(self.client.frequencies('a', 'bb'))
+        self.assertEqual(list(frame.frequency), [1, 2])
+
+    def test_iter_ngrams_resumes_from_offset(self):
+        results = list(self.client.iter_ngrams(2, contains='test', offset=230))
+        self.assertEqual([r['frequency'] for r in results], list(range(230, 250)))
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'frequencies.snap')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_build_snapshot_from_crawled_results(self):
+        client = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session())
+        client.corpus_size = 1000.0
+        n = build_snapshot(client, self.path, word_queries=[{'lemma': 'test'}],
+                           ngram_queries=[(2, {'contains': 'unit'})])
+        self.assertEqual(n, 251)
+        with Snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot), 251)
+            self.assertEqual(snapshot['test'], 7)
+            self.assertEqual(snapshot['unit 42'], 42)
+            self.assertNotIn('unit 250', snapshot)
+            self.assertEqual(snapshot.corpus_size, 1000.0)
+
+    def test_snapshot_client_falls_through_to_live_client(self):
+        write_snapshot(self.path, {'puerto': 4, 'rico': 8, 'puerto rico': 2, 'žluťoučký': 1}, corpus_size=64)
+        live = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session())
+        with SnapshotClient(self.path, client=live) as client:
+            self.assertEqual(client.pmi('puerto', 'rico'), 2.0)
+            self.assertEqual(client.frequency('žluťoučký'), 1)
+            self.assertEqual(list(client.frequencies('rico', 'missing').values()), [8, 7])
+            self.assertEqual(client.misses, 1)
+            self.assertEqual(live.num_queries, 1)
+
+    def test_vectorised_collocation_scores(self):
+        write_snapshot(self.path, {'a': 4, 'b': 8, 'c': 2, 'a b': 2, 'a c': 2}, corpus_size=64)
+        with SnapshotClient(self.path) as client:
+            scores = client.pmi_many([('a', 'b'), ('a', 'c'), ('b', 'c'), ('a', 'x')])
+            self.assertEqual(list(scores.pmi), [client.pmi('a', 'b'), client.pmi('a', 'c'), 0.0, 0.0])
+            self.assertAlmostEqual(scores.npmi[0], 2.0 / 5.0)
+            self.assertEqual(scores.log_likelihood[3], 0.0)
+            self.assertGreater(scores.log_likelihood[1], scores.log_likelihood[0])
+            matrix = client.pmi_matrix(['a', 'b'], ['b', 'c', 'x'])
+            self.assertEqual(matrix.pmi.shape, (2, 3))
+            self.assertEqual(matrix.pmi[0, 1], scores.pmi[1])
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_requests_pages_and_errors_are_recorded(self):
+        events = []
+        metrics = Metrics(callbacks=[lambda event, fields: events.append(event)])
+        client = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session(),
+                        cache=MemoryCache(), metrics=metrics)
+        client.ngrams(2, contains='test', length=250)
+        client.ngrams(2, contains='test', length=250)
+        path = '/stats/frequency/ngrams/en/nmc/2/'
+        self.assertEqual(metrics.requests[path, 200], 3)
+        self.assertEqual(metrics.latency[path].count, 3)
+        self.assertEqual(metrics.pages[path].sum, 6)
+        self.assertEqual(metrics.cache_hits[path], 3)
+        client.session.get.side_effect = lambda url, params, **kwargs: unittest.mock.MagicMock(status_code=403)
+        self.assertRaises(RequestError, client.word_stats, tc='test')
+        self.assertEqual(metrics.errors['/stats/frequency/word/en/', 'HTTP 403'], 1)
+        self.assertEqual(events.count('request'), 4)
+
+    def test_prometheus_text(self):
+        metrics = Metrics(latency_buckets=[0.1, 1.0])
+        metrics.record('request', path='/words/', status=200, latency=0.5, bytes=10)
+        metrics.record('rate_limit_wait', seconds=1.5)
+        text = metrics.to_prometheus()
+        self.assertIn('odapi_requests_total{path="/words/",status="200"} 1', text)
+        self.assertIn('odapi_request_duration_seconds_bucket{path="/words/",le="0.1"} 0', text)
+        self.assertIn('odapi_request_duration_seconds_bucket{path="/words/",le="+Inf"} 1', text)
+        self.assertIn('odapi_response_bytes_total{path="/words/"} 10', text)
+        self.assertIn('odapi_rate_limit_wait_seconds_total 1.5', text)
+
+
+class TestCorpusMetadata(unittest.TestCase):
+
+    def test_corpus_size_is_loaded_from_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'metadata.json')
+            client = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session(),
+                            metadata=CorpusMetadata(path))
+            self.assertEqual(client.corpus_size, 1000000.0)
+            self.assertEqual(client.num_queries, 1)
+            client = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session(),
+                            metadata=CorpusMetadata(path))
+            self.assertEqual(client.corpus_size, 1000000.0)
+            self.assertEqual(list(client.normalized_frequencies('a').values()), [1.0])
+            self.assertEqual(client.num_queries, 1)
+            other = Client(app_id='hoover', app_key='craft', rpm=1000, session=fake_session(),
+                           metadata=client.metadata, endpoint='http://localhost/api/v2')
+            other.corpus_size = 5.0
+            self.assertEqual(client.corpus_size, 1000000.0)
+
+    def test_stores_sharing_a_file_keep_each_others_values(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'metadata.json')
+            a, b = CorpusMetadata(path), CorpusMetadata(path)
+            a.set('x', 1)
+            b.set('y', 2)
+            a.set('z', 3)
+            self.assertEqual([CorpusMetadata(path).get(k) for k in 'xyz'], [1, 2, 3])
+
+    def test_stale_values_are_recomputed(self):
+        metadata = CorpusMetadata(max_age=60)
+        values = iter(range(10))
+        self.assertEqual(metadata.get('n', lambda: next(values)), 0)
+        self.assertEqual(metadata.get('n', lambda: next(values)), 0)
+        metadata.refresh()
+        self.assertEqual(metadata.get('n'), 1)
+        with unittest.mock.patch('odapi_client.time.time', return_value=time.time() + 120):
+            self.assertEqual(metadata.get('n', lambda: next(values)), 2)
+
+    def test_values_are_computed_once_outside_the_lock(self):
+        metadata = CorpusMetadata()
+        release = threading.Event()
+        computed = []
+
+        def compute():
+            computed.append(None)
+            release.wait()
+            return 42
+
+        with concurrent.futures.ThreadPoolExecutor(3) as executor:
+            futures = [executor.submit(metadata.get, 'slow', compute) for _ in range(3)]
+            while not computed:
+                time.sleep(0.001)
+            # other keys are not blocked by the computation
+            self.assertEqual(metadata.get('fast', lambda: 1), 1)
+            release.set()
+            self.assertEqual([f.result() for f in futures], [42] * 3)
+        self.assertEqual(len(computed), 1)
+
+    def test_async_values_are_recomputed(self):
+        metadata = CorpusMetadata(max_age=60)
+        values = iter(range(10))
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            return next(values)
+
+        async def main():
+            first = await asyncio.gather(*(metadata.aget('n', compute) for _ in range(3)))
+            with unittest.mock.patch('odapi_client.time.time', return_value=time.time() + 120):
+                return first, await metadata.aget('n', compute)
+
+        self.assertEqual(asyncio.run(main()), ([0, 0, 0], 1))
+
+
+class TestCrawlJob(unittest.TestCase):
+
+    def test_crawl_resumes_after_failure(self):
+        session = fake_session()
+        fail = unittest.mock.MagicMock(status_code=403, text='Quota exceeded')
+        session.get.side_effect = lambda url, params, **kwargs: (
+            fail if params.get('offset') == 200 else fake_response(url, params))
+        client = Client(app_id='hoover', app_key='craft', rpm=1000, session=session, max_retries=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            job = CrawlJob(os.path.join(tmp, 'crawl.jsonl'), n=2, contains='test')
+            self.assertRaises(RequestError, job.run, client)
+            self.assertEqual(job.progress(), (200, 250, False))
+            with open(job.path, 'a') as f:
+                f.write('{"offset": 200, "res')
+            # readers skip the incomplete line without changing the file
+            size = os.path.getsize(job.path)
+            self.assertEqual(job.progress(), (200, 250, False))
+            self.assertEqual(len(list(job.results())), 200)
+            self.assertEqual(os.path.getsize(job.path), size)
+            session.get.side_effect = lambda url, params, **kwargs: fake_response(url, params)
+            self.assertEqual(job.run(client), 50)
+            self.assertEqual(job.progress(), (250, 250, True))
+            self.assertEqual([r['frequency'] for r in job.results()], list(range(250)))
+            self.assertEqual(job.run(client), 0)
+
+
+class TestCache(unittest.TestCase):
+
+    def make_client(self, cache):
+        session = unittest.mock.MagicMock()
+        session.get().status_code = 200
+        session.get().content = b'{"result": {"frequency": 7}}'
+        session.get.reset_mock()
+        return Client(app_id='hoover', app_key='craft', rpm=1000, session=session, cache=cache)
+
+    def test_repeated_requests_are_served_from_cache(self):
+        client = self.make_client(MemoryCache())
+        self.assertEqual(client.word_frequency(tc='the'), 7)
+        self.assertEqual(client.word_frequency(tc='the'), 7)
+        self.assertEqual(client.session.get.call_count, 1)
+        self.assertEqual(client.cache.stats['hits'], 1)
+        self.assertEqual(client.cache.stats['misses'], 1)
+        client.word_stats(tc='the', use_cache=False)
+        self.assertEqual(client.session.get.call_count, 2)
+
+    def test_memory_cache_evicts_least_recently_used_and_expired(self):
+        cache = MemoryCache(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        with unittest.mock.patch('odapi_client.time.time', return_value=time.time() + 120):
+            self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.stats['evictions'], 2)
+
+    def test_sqlite_cache_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.db')
+            self.make_client(SqliteCache(path)).word_frequency(tc='the')
+            client = self.make_client(SqliteCache(path, max_entries=1))
+            self.assertEqual(client.word_frequency(tc='the'), 7)
+            self.assertEqual(client.session.get.call_count, 0)
+            client.cache.set('other', {})
+            self.assertEqual(len(client.cache), 1)
+            self.assertEqual(client.cache.stats['evictions'], 1)
+            client.cache.close()
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_burst_then_one_request_per_interval(self):
+        limiter = RateLimiter(interval=1.0, burst=3)
+        with unittest.mock.patch('odapi_client.time.time', return_value=100.0):
+            delays = [limiter.reserve() for _ in range(5)]
+        self.assertEqual(delays, [0.0, 0.0, 0.0, 1.0, 2.0])
+        self.assertEqual(limiter.waited, 3.0)
+
+    def test_quotas(self):
+        limiter = RateLimiter(interval=0.0, per_minute=2, per_month=3)
+        with unittest.mock.patch('odapi_client.time.time', return_value=100.0):
+            delays = [limiter.reserve() for _ in range(3)]
+            self.assertRaises(QuotaExceededError, limiter.reserve)
+        self.assertEqual(delays, [0.0, 0.0, 30.0])
+
+    def test_file_limiter_is_shared(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'limiter.json')
+            workers = [FileRateLimiter(path, interval=2.0), FileRateLimiter(path, interval=2.0)]
+            with unittest.mock.patch('odapi_client.time.time', return_value=100.0):
+                delays = [worker.reserve() for worker in workers]
+            self.assertEqual(delays, [0.0, 2.0])
+            self.assertEqual(workers[0].usage()['requests'], 2)
+            self.assertEqual(workers[0].waited, 2.0)
+
+
+class TestPriorityScheduler(unittest.TestCase):
+
+    def test_interactive_requests_skip_queued_batch_requests(self):
+        release = threading.Event()
+        order = []
+        limiter = unittest.mock.MagicMock()
+        limiter.acquire.side_effect = lambda: order.append(threading.current_thread().name) or release.wait()
+        scheduler = PriorityScheduler(limiter, {'interactive': 3, 'batch': 1})
+
+        def start(priority, count):
+            threads = [threading.Thread(target=scheduler.acquire, args=(priority, ), name=priority)
+                       for _ in range(count)]
+            for thread in threads:
+                thread.start()
+            return threads
+
+        threads = start('batch', 1)
+        while not order:
+            time.sleep(0.001)
+        threads += start('batch', 4)
+        while scheduler.stats()['batch']['queued'] < 4:
+            time.sleep(0.001)
+        threads += start('interactive', 2)
+        while scheduler.stats()['interactive']['queued'] < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ['batch', 'interactive', 'interactive', 'batch', 'batch', 'batch', 'batch'])
+        stats = scheduler.stats()
+        self.assertEqual((stats['batch']['requests'], stats['batch']['queued']), (5, 0))
+        self.assertGreater(stats['batch']['max_wait'], 0.0)
+        self.assertRaises(ArgumentError, scheduler.acquire, 'background')
+
+    def test_client_requests_go_through_scheduler(self):
+        scheduler = PriorityScheduler(RateLimiter(interval=0.0))
+        client = Client(app_id='hoover', app_key='craft', session=fake_session(), scheduler=scheduler)
+        self.assertIs(client.limiter, scheduler.limiter)
+        client.word_stats(tc='a')
+        client.word_stats(tc='b', priority='interactive')
+        self.assertEqual(client.session.get.call_args[1]['params'], {'trueCase': 'b'})
+        stats = scheduler.stats()
+        self.assertEqual((stats['interactive']['requests'], stats['batch']['requests']), (1, 1))
+
+    def test_client_rate_conflicting_with_scheduler_is_rejected(self):
+        scheduler = PriorityScheduler(RateLimiter(interval=0.0))
+        keys = dict(app_id='hoover', app_key='craft', scheduler=scheduler)
+        self.assertRaises(ConfigError, Client, rpm=100, **keys)
+        self.assertRaises(ConfigError, Client, burst=5, **keys)
+        self.assertRaises(ConfigError, Client, adaptive=True, **keys)
+        self.assertRaises(ConfigError, Client, limiter=RateLimiter(), **keys)
+        self.assertIs(Client(limiter=scheduler.limiter, **keys).limiter, scheduler.limiter)
+
+
+class TestCredentialPool(unittest.TestCase):
+
+    def test_requests_are_spread_over_keys(self):
+        pool = CredentialPool([('a', 'A'), ('b', 'B')], rpm=10)
+        client = Client(session=fake_session(), credentials=pool)
+        for word in 'wxyz':
+            client.word_stats(tc=word)
+        keys = [call[1]['headers']['app_id'] for call in client.session.get.call_args_list]
+        self.assertEqual(keys, ['a', 'b', 'a', 'b'])
+        self.assertEqual([u['requests'] for u in pool.usage().values()], [2, 2])
+        self.assertEqual(pool.credentials[0].limiter.interval, Client(rpm=10, credentials=pool).rate)
+
+    def test_throttled_key_is_rested(self):
+        session = fake_session()
+        throttled = unittest.mock.MagicMock(status_code=429, headers={'Retry-After': '30'})
+        session.get.side_effect = lambda url, params, headers, **kwargs: (
+            throttled if headers['app_id'] == 'a' else fake_response(url, params))
+        pool = CredentialPool([('a', 'A'), ('b', 'B', RateLimiter(interval=0.0, per_month=100))], rpm=10000)
+        client = Client(session=session, credentials=pool)
+        client.word_stats(tc='x')
+        client.word_stats(tc='y')
+        keys = [call[1]['headers']['app_id'] for call in session.get.call_args_list]
+        self.assertEqual(keys, ['a', 'b', 'b'])
+        usage = pool.usage()
+        self.assertEqual((usage['a']['statuses'], usage['a']['cooldowns']), ({429: 1}, 1))
+        self.assertGreater(usage['a']['cooling_down'], 29.0)
+        self.assertEqual(usage['b']['month_remaining'], 98)
+        self.assertRaises(ConfigError, Client, credentials=pool, scheduler=PriorityScheduler())
+
+    def test_rejected_key_fails_without_waiting_for_cooldown(self):
+        session = fake_session()
+        session.get.return_value = unittest.mock.MagicMock(status_code=401, headers={}, text='Unauthorized')
+        session.get.side_effect = None
+        pool = CredentialPool([('a', 'A'), ('b', 'B')], rpm=10000, cooldown=60)
+        client = Client(session=session, credentials=pool)
+        start = time.time()
+        self.assertRaises(RequestError, client.word_stats, tc='x')
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual([call[1]['headers']['app_id'] for call in session.get.call_args_list], ['a', 'b'])
+
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+
+    def test_backs_off_on_429_and_recovers(self):
+        limiter = AdaptiveRateLimiter(interval=0.001, recovery_after=2, recovery=0.5, jitter=0.0)
+        session = fake_session()
+        throttled = unittest.mock.MagicMock(status_code=429, headers={'Retry-After': '0.01'})
+        responses = [throttled, throttled]
+        session.get.side_effect = lambda url, params, **kwargs: (
+            responses.pop() if responses else fake_response(url, params))
+        client = Client(app_id='hoover', app_key='craft', session=session, limiter=limiter)
+        self.assertEqual(client.word_frequency(tc='the'), 1)
+        self.assertEqual(session.get.call_count, 3)
+        self.assertEqual(limiter.throttles, 2)
+        self.assertAlmostEqual(limiter.interval, 0.004)
+        client.word_frequency(tc='a')
+        self.assertAlmostEqual(limiter.interval, 0.002)
+        self.assertAlmostEqual(limiter.rpm, 500)
+        self.assertAlmostEqual(limiter.requests_per_minute, 30000)
+
+    def test_concurrent_429s_back_off_once(self):
+        limiter = AdaptiveRateLimiter(interval=0.001, burst=16, recovery_after=100, jitter=0.0)
+        session = fake_session()
+        throttled = unittest.mock.MagicMock(status_code=429, headers={'Retry-After': '0.01'})
+        barrier = threading.Barrier(16)
+        calls = iter(range(100))
+        lock = threading.Lock()
+
+        def get(url, params, **kwargs):
+            with lock:
+                call = next(calls)
+            if call < 16:
+                # all sixteen requests are in flight when the server throttles them
+                barrier.wait()
+                return throttled
+            return fake_response(url, params)
+
+        session.get.side_effect = get
+        client = Client(app_id='hoover', app_key='craft', session=session, limiter=limiter)
+        with concurrent.futures.ThreadPoolExecutor(16) as executor:
+            list(executor.map(lambda w: client.word_frequency(tc=w), 'abcdefghijklmnop'))
+        self.assertEqual(limiter.throttles, 16)
+        self.assertAlmostEqual(limiter.interval, 0.002)
+
+    def test_stragglers_neither_extend_the_pause_nor_recover(self):
+        limiter = AdaptiveRateLimiter(interval=0.01, recovery_after=1, jitter=0.0)
+        reserved = time.time()
+        pause = limiter.throttled(0.05, reserved)
+        interval = limiter.interval
+        for _ in range(20):
+            self.assertLessEqual(limiter.throttled(1.0, reserved), pause)
+        self.assertEqual((limiter.throttles, limiter.interval), (21, interval))
+        limiter.succeeded(reserved)
+        limiter.succeeded(time.time())
+        self.assertEqual(limiter.interval, interval)
+        time.sleep(pause)
+        limiter.succeeded(time.time())
+        self.assertLess(limiter.interval, interval)
+
+    def test_burst_does_not_cut_the_pause_short(self):
+        limiter = AdaptiveRateLimiter(interval=0.001, burst=16, jitter=0.0)
+        pause = limiter.throttled(0.05)
+        self.assertGreater(limiter.delay(), pause - 0.01)
+
+    def test_session_leaves_429_to_adaptive_limiter(self):
+        client = Client(app_id='hoover', app_key='craft', adaptive=True)
+        self.assertIsInstance(client.limiter, AdaptiveRateLimiter)
+        self.assertNotIn(429, client.session.get_adapter('https://').max_retries.status_forcelist)
+        client.close()
+
+
+class TestAsyncClient(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        from aiohttp import web
+
+        async def ngrams(request):
+            offset = int(request.query.get('offset', 0))
+            limit = int(request.query.get('limit', 100))
+            tokens = request.query.getall('tokens', [])
+            results = ([{'tokens': t.split(' '), 'frequency': 5} for t in tokens] if tokens else
+                       [{'tokens': ['a', str(i)], 'frequency': i} for i in range(offset, min(offset + limit, 250))])
+            return web.json_response({'metadata': {'total': len(tokens) or 250,
+                                                   'options': {'limit': limit, 'offset': offset}},
+                                      'results': results})
+
+        self.throttled = 0
+
+        async def words(request):
+            if 'busy' in request.query.getall('trueCases') and not self.throttled:
+                self.throttled += 1
+                return web.Response(status=429, headers={'Retry-After': '0'})
+            results = [{'trueCase': tc, 'frequency': 2} for tc in request.query.getall('trueCases')]
+            return web.json_response({'metadata': {'total': len(results), 'options': {'limit': 100, 'offset': 0}},
+                                      'results': results})
+
+        app = web.Application()
+        app.router.add_get('/stats/frequency/ngrams/en/nmc/{n}/', ngrams)
+        app.router.add_get('/stats/frequency/words/en/', words)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.client = AsyncClient(app_id='hoover', app_key='craft', rpm=1000,
+                                  endpoint='http://127.0.0.1:{}'.format(port))
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.runner.cleanup()
+
+    async def test_pages_are_fetched_after_the_first(self):
+        results = await self.client.ngrams(2, contains='a', length=-1)
+        self.assertEqual([r['frequency'] for r in results], list(range(250)))
+        self.assertEqual(self.client.num_queries, 3)
+
+    async def test_frequencies(self):
+        rv = await self.client.frequencies('the', 'a test')
+        self.assertEqual(list(rv.items()), [('the', 2), ('a test', 5)])
+
+    async def test_throttled_request_waits_for_retry_after(self):
+        self.client.backoff_factor = 60
+        start = time.time()
+        rv = await self.client.frequencies('busy')
+        self.assertEqual(rv['busy'], 2)
+        self.assertEqual(self.throttled, 1)
+        self.assertLess(time.time() - start, 5.0)
+
+
+class TestMockServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = MockServer(words=300, ngrams=600).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.client = Client(app_id='hoover', app_key='craft', rpm=10000, endpoint=self.server.endpoint)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_pagination_and_frequencies(self):
+        corpus = self.server.corpus
+        word = corpus.words[0]
+        ngrams = self.client.ngrams(2, contains=word, length=-1)
+        self.assertEqual(len(ngrams), len(corpus.containing[2][word]))
+        self.assertGreater(len(ngrams), 100)
+        phrase = ' '.join(ngrams[0]['tokens'])
+        rv = self.client.frequencies(word, phrase, 'notaword')
+        self.assertEqual(list(rv.values()), [corpus.zipf(0), ngrams[0]['frequency'], 0])
+
+    def test_recorded_traffic_is_replayed_offline(self):
+        corpus = self.server.corpus
+        words = corpus.words[:3]
+        with tempfile.TemporaryDirectory() as tmp:
+            log = os.path.join(tmp, 'traffic.jsonl.gz')
+            client = Client(app_id='hoover', app_key='craft', rpm=10000, endpoint=self.server.endpoint,
+                            adaptive=True)
+            with RecordingSession.attach(client, log) as session:
+                self.assertNotIn(429, session.session.get_adapter('http://').max_retries.status_forcelist)
+                ngrams = client.ngrams(2, contains=words[0], length=-1)
+                pmi = client.pmi(words[0], words[1])
+            entries = read_traffic(log)
+            self.assertEqual(len(entries), 5)
+            self.assertNotIn('craft', json.dumps(entries))
+            replay = Client(app_id='x', app_key='y', endpoint='http://offline', rpm=10000, session=ReplaySession(log))
+            self.assertEqual(replay.ngrams(2, contains=words[0], length=-1), ngrams)
+            self.assertEqual(replay.pmi(words[0], words[1]), pmi)
+            self.assertRaises(RequestError, replay.frequency, 'notrecorded')
+            results = replay_traffic(Client(app_id='x', app_key='y', endpoint='http://offline', rpm=10000,
+                                            session=ReplaySession(log, speed=1000.0)), log)
+            self.assertEqual([r.error for r in results], [None] * 5)
+            self.assertEqual(results[1].result['results'], ngrams[100:200])
+            offline = unittest.mock.MagicMock()
+            offline.get.side_effect = requests.ConnectionError('offline')
+            results = replay_traffic(Client(app_id='x', app_key='y', rpm=10000, session=offline), log, speed=None)
+            self.assertEqual([type(r.error) for r in results], [requests.ConnectionError] * 5)
+
+    def test_crawl_shards_in_processes(self):
+        corpus = self.server.corpus
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = [CrawlJob(os.path.join(tmp, '{}.jsonl'.format(n)), n=n, contains=corpus.words[0])
+                    for n in (2, 3)]
+            summary = run_crawl_jobs(jobs, {'app_id': 'hoover', 'app_key': 'craft', 'rpm': 10000,
+                                            'endpoint': self.server.endpoint}, processes=2)
+            self.assertEqual([s['done'] for s in summary], [True, True])
+            for n, job in zip((2, 3), jobs):
+                self.assertEqual(len(list(job.results())), len(corpus.containing[n][corpus.words[0]]))
+
+    def test_throttled_requests_raise(self):
+        self.server.error_rate = 1.0
+        try:
+            client = Client(app_id='hoover', app_key='craft', rpm=10000, endpoint=self.server.endpoint,
+                            max_retries=0)
+            with self.assertRaises(RequestError) as cm:
+                client.frequency('the')
+            self.assertEqual(cm.exception.response.status_code, 429)
+        finally:
+            self.server.error_rate = 0.0
 
 
 if __name__ == '__main__':